@@ -0,0 +1,36 @@
+'''Memory benchmark for the search on the Sokoban problem set.
+
+   Solves problems with breadth first search and A* (full cycle
+   checking), with and without compact paths (see
+   SearchEngine.set_compact_paths), and reports the peak memory
+   allocated during the search (measured with tracemalloc) per search
+   node, and the number of nodes that fit in a GB at that rate.'''
+
+import sys
+import tracemalloc
+from search import *
+from sokoban import PROBLEMS, sokoban_goal_state
+from solution import heur_manhattan_distance
+
+def run(s0, strategy, compact, timebound=60):
+    '''Solve s0, returning (cost, nodes, peak bytes)'''
+    se = SearchEngine(strategy, 'full')
+    se.set_verbose(False)
+    se.set_compact_paths(compact)
+    tracemalloc.start()
+    se.init_search(s0, goal_fn=sokoban_goal_state, heur_fn=heur_manhattan_distance)
+    goal = se.search(timebound)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return (goal.gval if goal else None), se.stats.nodes, peak
+
+if __name__ == "__main__":
+    problems = [int(i) for i in sys.argv[1:]] or range(0, 6)
+    fmt = "{:>7} {:>13} {:>7} {:>5} {:>8} {:>11} {:>10} {:>12}"
+    print(fmt.format("problem", "strategy", "compact", "cost", "nodes", "peak bytes", "bytes/node", "nodes/GB"))
+    for i in problems:
+        for strategy in ('breadth_first', 'astar'):
+            for compact in (False, True):
+                cost, nodes, peak = run(PROBLEMS[i], strategy, compact)
+                print(fmt.format(i, strategy, str(compact), str(cost), nodes, peak,
+                                 peak // nodes, (2**30 * nodes) // peak))
@@ -0,0 +1,68 @@
+'''Benchmark of the OPEN list used with full cycle checking.
+
+   Compares the lazy scheme (push a new node for every cheaper path
+   found and skip the stale entries when they are extracted) with the
+   indexed heap that keeps one entry per state and uses decrease-key.
+   For each problem it reports the peak and total number of entries
+   pushed onto OPEN, the number of extracted entries for states that
+   had already been extracted before (stale entries, and duplicates
+   pushed with an equal g-value that the lazy scheme expands again),
+   and the number of expansions per second.'''
+
+import io
+import os
+import contextlib
+from search import *
+from sokoban import PROBLEMS, sokoban_goal_state
+from solution import heur_manhattan_distance
+
+def run(s0, decrease_key, strategy='astar', heur_fn=heur_manhattan_distance, timebound=10):
+    '''Run one search, returning a dict of OPEN list measurements.'''
+    se = SearchEngine(strategy, 'full')
+    se.set_decrease_key(decrease_key)
+    se.init_search(s0, goal_fn=sokoban_goal_state, heur_fn=heur_fn)
+
+    counts = {'pushed': 0, 'peak': 0, 'extracted': 0, 'repeated': 0}
+    seen = set()
+    open_list = se.open
+    insert = open_list.insert
+    extract = open_list.extract
+
+    def counted_insert(node, key=None):
+        insert(node, key)
+        counts['pushed'] += 1
+        if len(open_list.open) > counts['peak']:
+            counts['peak'] = len(open_list.open)
+
+    def counted_extract():
+        node = extract()
+        counts['extracted'] += 1
+        key = node.state.hashable_state()
+        if key in seen:
+            counts['repeated'] += 1
+        seen.add(key)
+        return node
+
+    open_list.insert = counted_insert
+    open_list.extract = counted_extract
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = os.times()[0]
+        goal = se.search(timebound)
+        elapsed = os.times()[0] - start
+
+    expanded = counts['extracted']
+    counts['cost'] = goal.gval if goal else None
+    counts['time'] = elapsed
+    counts['expansions_per_sec'] = expanded / elapsed if elapsed > 0 else float("inf")
+    return counts
+
+if __name__ == "__main__":
+    fmt = "{:>7} {:>6} {:>5} {:>8} {:>8} {:>8} {:>7} {:>10}"
+    print(fmt.format("problem", "scheme", "cost", "pushed", "peak", "repeat", "time", "exp/sec"))
+    for i in range(0, 6):
+        for decrease_key in (False, True):
+            r = run(PROBLEMS[i], decrease_key)
+            print(fmt.format(i, "dkey" if decrease_key else "lazy", str(r['cost']), r['pushed'],
+                             r['peak'], r['repeated'], "{:.2f}".format(r['time']),
+                             "{:.0f}".format(r['expansions_per_sec'])))
@@ -0,0 +1,229 @@
+'''Benchmark suite for the search strategies on the Sokoban problem sets.
+
+   Runs every combination of problem (from sokoban.PROBLEMS and
+   test_problems.PROBLEMS), SearchEngine strategy, cycle check level
+   and heuristic from solution.py, and records for each run whether it
+   was solved, the solution cost, the nodes expanded and states
+   generated, the peak size of OPEN, the peak memory of the process and
+   the wall-clock and CPU time. The uninformed strategies
+   (depth_first, breadth_first and ucs) are run once per cycle check
+   level, with no heuristic. The custom strategy uses
+   solution.fval_function with weight CUSTOM_WEIGHT.
+
+   Each run is done in its own worker process (several at a time with
+   --workers), so the peak memory (ru_maxrss) of a run is not affected
+   by the others. The results are written as JSON, and can be compared
+   with those of an earlier version: runs that are no longer solved,
+   find a more expensive solution, or use more than (1 + threshold)
+   times the expansions, generations, memory or time are reported as
+   regressions (and the exit status is 1).
+
+   For example,
+       python benchmark.py --strategies astar focal --out new.json
+       python benchmark.py --compare old.json new.json --threshold 0.2
+'''
+import argparse
+import functools
+import json
+import os
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+try:
+    import resource
+except ImportError:
+    resource = None
+from search import *
+import sokoban
+import test_problems
+import solution
+
+PROBLEM_SETS = {'sokoban': sokoban.PROBLEMS, 'test': test_problems.PROBLEMS}
+STRATEGIES = ['depth_first', 'breadth_first', 'ucs', 'best_first', 'astar', 'custom',
+              'ida_star', 'beam', 'beam_stack', 'focal', 'rbfs', 'sma_star']
+CC_LEVELS = ['none', 'path', 'full']
+HEURISTICS = {'displaced': solution.heur_displaced,
+              'manhattan': solution.heur_manhattan_distance,
+              'alternate': solution.heur_alternate,
+              'push_distance': solution.heur_push_distance,
+              'push_assignment': solution.heur_push_assignment}
+#strategies that don't use a heuristic are only run with 'zero'
+UNINFORMED = ['depth_first', 'breadth_first', 'ucs']
+CUSTOM_WEIGHT = 2.
+
+#Metrics compared with a threshold by compare
+METRICS = ['expanded', 'generated', 'peak_memory', 'wall_time']
+
+#One benchmark run: the problem set and problem number, strategy, cycle
+#check level and heuristic name.
+Case = namedtuple('Case', ['problem_set', 'problem', 'strategy', 'cc_level', 'heuristic'])
+
+def case_key(case):
+    '''The name of a run, used to match runs when comparing results'''
+    return "{}/{}/{}/{}/{}".format(*case)
+
+def cases(problem_sets=None, strategies=None, cc_levels=None, heuristics=None, problems=None):
+    '''Return the list of Cases for the given problem set names,
+       strategies, cycle check levels, heuristic names and problem
+       numbers (None for all of them)'''
+    result = []
+    for set_name in problem_sets or sorted(PROBLEM_SETS):
+        numbers = problems if problems is not None else range(len(PROBLEM_SETS[set_name]))
+        for i in numbers:
+            if i >= len(PROBLEM_SETS[set_name]):
+                continue
+            for strategy in strategies or STRATEGIES:
+                for cc in cc_levels or CC_LEVELS:
+                    if strategy in ['ida_star', 'rbfs', 'sma_star'] and cc == 'full':
+                        continue
+                    if strategy in UNINFORMED:
+                        names = ['zero']
+                    else:
+                        names = heuristics or sorted(HEURISTICS)
+                    for heur_name in names:
+                        result.append(Case(set_name, i, strategy, cc, heur_name))
+    return result
+
+def _peak_memory():
+    '''Peak resident set size of this process in bytes (0 if unknown)'''
+    if resource is None:
+        return 0
+    #ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+def run_case(case, timebound=5):
+    '''Run one benchmark case and return its results as a dictionary'''
+    state = PROBLEM_SETS[case.problem_set][case.problem]
+    se = SearchEngine(case.strategy, case.cc_level)
+    se.set_verbose(False)
+    kwargs = {}
+    if case.heuristic != 'zero':
+        kwargs['heur_fn'] = HEURISTICS[case.heuristic]
+    if case.strategy == 'custom':
+        kwargs['fval_function'] = functools.partial(solution.fval_function, weight=CUSTOM_WEIGHT)
+    se.init_search(state, sokoban.sokoban_goal_state, **kwargs)
+    goal = se.search(timebound)
+    stats = se.stats
+    return {'case': case_key(case),
+            'problem_set': case.problem_set,
+            'problem': case.problem,
+            'strategy': case.strategy,
+            'cc_level': case.cc_level,
+            'heuristic': case.heuristic,
+            'solved': bool(goal),
+            'cost': goal.gval if goal else None,
+            'reason': None if goal else getattr(goal, 'reason', 'failed'),
+            'expanded': stats.expanded,
+            'generated': stats.generated,
+            'nodes': stats.nodes,
+            'peak_open': stats.peak_open,
+            'peak_memory': _peak_memory(),
+            'wall_time': stats.wall_time,
+            'cpu_time': stats.elapsed}
+
+def _executor(workers):
+    '''A process pool that (where supported) uses a new process for each run'''
+    try:
+        return ProcessPoolExecutor(workers, max_tasks_per_child=1)
+    except TypeError:
+        #before Python 3.11 processes are reused, so peak_memory is the
+        #peak of all the runs a worker has done so far
+        return ProcessPoolExecutor(workers)
+
+def run_benchmark(case_list, timebound=5, workers=1, progress=True):
+    '''Run the cases (workers at a time) and return the list of results'''
+    results = []
+    with _executor(workers) as pool:
+        futures = [pool.submit(run_case, case, timebound) for case in case_list]
+        for case, future in zip(case_list, futures):
+            result = future.result()
+            results.append(result)
+            if progress:
+                print("{:<50} {:>6} {:>6} {:>9} {:>8.2f}s".format(
+                    result['case'], 'solved' if result['solved'] else 'failed',
+                    str(result['cost']), result['expanded'], result['wall_time']))
+    return results
+
+def save_results(results, path, label=None, timebound=None):
+    '''Write the results to path as JSON'''
+    data = {'label': label,
+            'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'timebound': timebound,
+            'results': results}
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=1)
+
+def load_results(path):
+    '''Read results written by save_results, as a dictionary from case name to result'''
+    with open(path) as f:
+        data = json.load(f)
+    return dict((result['case'], result) for result in data['results'])
+
+def compare(baseline, current, threshold=0.1, min_time=0.05):
+    '''Compare two dictionaries of results (see load_results) and return
+       a list of regressions found in current, as strings. Times below
+       min_time seconds in both are not compared (they are mostly noise).'''
+    regressions = []
+    for key in sorted(baseline):
+        if key not in current:
+            continue
+        old = baseline[key]
+        new = current[key]
+        if old['solved'] and not new['solved']:
+            regressions.append("{}: no longer solved ({})".format(key, new['reason']))
+            continue
+        if old['solved'] and new['cost'] > old['cost']:
+            regressions.append("{}: cost {} -> {}".format(key, old['cost'], new['cost']))
+        for metric in METRICS:
+            if metric == 'wall_time' and max(old[metric], new[metric]) < min_time:
+                continue
+            if not new['solved']:
+                #both unsolved: the counts only show how far the search got
+                break
+            if new[metric] > (1 + threshold) * old[metric]:
+                regressions.append("{}: {} {} -> {}".format(key, metric, old[metric], new[metric]))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the search strategies on the Sokoban problems.')
+    parser.add_argument('--sets', nargs='*', choices=sorted(PROBLEM_SETS), help='problem sets (default all)')
+    parser.add_argument('--problems', nargs='*', type=int, help='problem numbers (default all)')
+    parser.add_argument('--strategies', nargs='*', choices=STRATEGIES, help='strategies (default all)')
+    parser.add_argument('--cc', nargs='*', choices=CC_LEVELS, help='cycle check levels (default all)')
+    parser.add_argument('--heuristics', nargs='*', choices=sorted(HEURISTICS), help='heuristics (default all)')
+    parser.add_argument('--timebound', type=float, default=5, help='CPU seconds per run (default 5)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='runs at a time')
+    parser.add_argument('--out', help='write the results to this JSON file')
+    parser.add_argument('--label', help='label stored with the results (e.g., a version)')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'),
+                        help='compare two results files instead of running the benchmark')
+    parser.add_argument('--baseline', help='compare the new results with this results file')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='relative increase reported as a regression (default 0.1)')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        baseline = load_results(args.compare[0])
+        current = load_results(args.compare[1])
+    else:
+        case_list = cases(args.sets, args.strategies, args.cc, args.heuristics, args.problems)
+        print("Running {} cases".format(len(case_list)))
+        results = run_benchmark(case_list, args.timebound, args.workers)
+        print("Solved {} of {}".format(sum(r['solved'] for r in results), len(results)))
+        if args.out:
+            save_results(results, args.out, args.label, args.timebound)
+        if not args.baseline:
+            return 0
+        baseline = load_results(args.baseline)
+        current = dict((r['case'], r) for r in results)
+
+    regressions = compare(baseline, current, args.threshold)
+    for regression in regressions:
+        print("REGRESSION", regression)
+    print("{} regressions in {} common cases".format(len(regressions), len(set(baseline) & set(current))))
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
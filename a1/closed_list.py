@@ -0,0 +1,230 @@
+'''Closed list backends for SearchEngine.
+
+   With full cycle checking SearchEngine keeps the cheapest g-value
+   found for every state it has reached in its cycle check dictionary
+   (the closed list). By default this is a Python dict, which grows
+   until memory runs out. SearchEngine.set_closed_list takes a function
+   that creates a replacement, such as the classes below. A closed list
+   must support "key in closed", closed[key], closed[key] = gval and
+   len(closed), and items() to be saved by SearchEngine.checkpoint.
+   A closed list whose items() are not the original keys must have a
+   true hashed_keys attribute.
+
+   A) class MappedClosedList
+
+      An open addressing hash table (linear probing) stored in a
+      memory-mapped file of fixed-width 16 byte records: a 64-bit key
+      and a g-value (a double). The operating system pages the file in
+      and out, so the table can grow well beyond the available RAM.
+      Keys that are not ints are replaced by a 64-bit hash of their
+      repr() (the same in every process, unlike hash() of a string), and
+      ints are cut to 64 bits, so two different states whose keys have
+      the same 64-bit hash are treated as the same state. With Zobrist keys (see
+      sokoban.py) the keys are already random 64-bit numbers.
+
+   B) class SpillingClosedList
+
+      A dict that moves all of its entries into a MappedClosedList once
+      it holds more than a given number of entries or the process uses
+      more than a given amount of memory, and uses the mapped table from
+      then on.
+
+   For example,
+       se.set_closed_list(lambda: SpillingClosedList(max_memory=2 * 2**30))
+'''
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+from search import _memory_usage
+
+_RECORD = struct.Struct('<Qd')
+_MASK64 = (1 << 64) - 1
+#key 0 marks an empty record; a real key of 0 is stored as _ZERO_KEY
+_ZERO_KEY = _MASK64
+
+def _record_key(key):
+    '''The 64-bit (non-zero) key stored for key'''
+    if not isinstance(key, int):
+        key = int.from_bytes(hashlib.blake2b(repr(key).encode(), digest_size=8).digest(), 'little')
+    key = key & _MASK64
+    return key if key else _ZERO_KEY
+
+class MappedClosedList:
+    '''Closed list stored in a memory-mapped file (see the module documentation).'''
+
+    #items() gives the 64-bit record keys, not the original keys
+    hashed_keys = True
+
+    def __init__(self, path=None, capacity=1 << 16, max_load=0.7):
+        '''
+        @param path: the file to store the table in. If None a temporary file
+               is used, and it is deleted when the table is closed.
+        @param capacity: initial number of records (rounded up to a power of two).
+        @param max_load: the table is doubled in size when it is fuller than this.
+        '''
+        size = 1
+        while size < capacity:
+            size = size * 2
+        self.max_load = max_load
+        self.count = 0
+        self.temporary = path is None
+        if path is None:
+            fd, path = tempfile.mkstemp(prefix='closed_', suffix='.tbl')
+            os.close(fd)
+        self.path = path
+        self._open(size)
+
+    def _open(self, capacity):
+        '''Create an empty table of capacity records in self.path'''
+        self.capacity = capacity
+        self.mask = capacity - 1
+        self.limit = int(capacity * self.max_load)
+        self.file = open(self.path, 'w+b')
+        self.file.truncate(capacity * _RECORD.size)
+        self.map = mmap.mmap(self.file.fileno(), capacity * _RECORD.size)
+
+    def _slot(self, rkey):
+        '''Return the record number holding rkey, or the empty record where it would go'''
+        #multiply to spread keys that are not random over the table
+        i = ((rkey * 0x9E3779B97F4A7C15) & _MASK64) >> 20 & self.mask
+        unpack_from = _RECORD.unpack_from
+        mapped = self.map
+        mask = self.mask
+        while True:
+            k, g = unpack_from(mapped, i * 16)
+            if k == rkey or k == 0:
+                return i, k, g
+            i = (i + 1) & mask
+
+    def __len__(self): return self.count
+
+    def __contains__(self, key):
+        return self._slot(_record_key(key))[1] != 0
+
+    def __getitem__(self, key):
+        i, k, g = self._slot(_record_key(key))
+        if k == 0:
+            raise KeyError(key)
+        return g
+
+    def get(self, key, default=None):
+        i, k, g = self._slot(_record_key(key))
+        return g if k else default
+
+    def __setitem__(self, key, gval):
+        rkey = _record_key(key)
+        i, k, g = self._slot(rkey)
+        _RECORD.pack_into(self.map, i * 16, rkey, gval)
+        if k == 0:
+            self.count = self.count + 1
+            if self.count > self.limit:
+                self._grow()
+
+    def items(self):
+        '''Iterate over the (64-bit key, gval) records in the table. The
+           64-bit keys can be used in place of the original keys.'''
+        unpack_from = _RECORD.unpack_from
+        for i in range(self.capacity):
+            k, g = unpack_from(self.map, i * 16)
+            if k:
+                yield k, g
+
+    def _grow(self):
+        '''Double the size of the table'''
+        old_map = self.map
+        old_file = self.file
+        old_capacity = self.capacity
+        old_path = self.path
+        self.path = old_path + '.grow'
+        self._open(old_capacity * 2)
+        unpack_from = _RECORD.unpack_from
+        pack_into = _RECORD.pack_into
+        for j in range(old_capacity):
+            k, g = unpack_from(old_map, j * 16)
+            if k:
+                i = self._slot(k)[0]
+                pack_into(self.map, i * 16, k, g)
+        old_map.close()
+        old_file.close()
+        os.replace(self.path, old_path)
+        self.path = old_path
+
+    def close(self):
+        '''Unmap the table (and delete it if it is a temporary file)'''
+        if self.map is None:
+            return
+        self.map.close()
+        self.file.close()
+        self.map = None
+        if self.temporary:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+    def __del__(self):
+        self.close()
+
+    def __repr__(self):
+        return "MappedClosedList(path={}, entries={}, capacity={})".format(self.path, self.count, self.capacity)
+
+class SpillingClosedList:
+    '''Closed list kept in a dict until it passes a size or memory
+       threshold, then moved to a MappedClosedList.'''
+
+    def __init__(self, max_entries=None, max_memory=None, path=None, check_every=4096):
+        '''
+        @param max_entries: spill once the dict holds more entries than this.
+        @param max_memory: spill once the process uses more than this many bytes
+               (approximately, checked every check_every new entries).
+        @param path: the file for the MappedClosedList (None for a temporary file).
+        '''
+        self.max_entries = max_entries
+        self.max_memory = max_memory
+        self.path = path
+        self.check_every = check_every
+        self.table = dict()
+        self.spilled = False
+
+    def __len__(self): return len(self.table)
+
+    def __contains__(self, key): return key in self.table
+
+    def __getitem__(self, key): return self.table[key]
+
+    def get(self, key, default=None): return self.table.get(key, default)
+
+    def items(self): return self.table.items()
+
+    @property
+    def hashed_keys(self): return self.spilled
+
+    def __setitem__(self, key, gval):
+        table = self.table
+        table[key] = gval
+        if self.spilled:
+            return
+        size = len(table)
+        if ((self.max_entries is not None and size > self.max_entries) or
+            (self.max_memory is not None and size % self.check_every == 0 and
+             _memory_usage() > self.max_memory)):
+            self.spill()
+
+    def spill(self):
+        '''Move the entries to a MappedClosedList and use it from now on'''
+        if self.spilled:
+            return
+        mapped = MappedClosedList(self.path, capacity=max(1 << 16, 2 * len(self.table)))
+        for key, gval in self.table.items():
+            mapped[key] = gval
+        self.table = mapped
+        self.spilled = True
+
+    def close(self):
+        if self.spilled:
+            self.table.close()
+
+    def __repr__(self):
+        return "SpillingClosedList(spilled={}, entries={})".format(self.spilled, len(self.table))
@@ -0,0 +1,270 @@
+'''Hash distributed A* (HDA*).
+
+   A parallel A* search over worker processes. Every state is owned by
+   one worker, chosen by hashing its hashable_state() key. Each worker
+   keeps its own OPEN list and its own table of the cheapest path (g
+   value, state and parent key) found to each state it owns. A worker
+   repeatedly expands its best node and sends each successor to the
+   successor's owner; successors for other workers are collected in
+   local outgoing buffers and sent as one message per worker after a
+   round of expansions.
+
+   When a worker expands a goal it reports it, and the best goal cost
+   (the incumbent) is broadcast to all workers, which then ignore nodes
+   whose f-value is not below it. The search has finished when every
+   worker is idle (nothing on OPEN below the incumbent) and no messages
+   are in flight. This is detected by probing all workers for their
+   counts of messages sent and received: the search stops once two
+   consecutive probe rounds find every worker idle, with unchanged
+   counts, and the total sent equal to the total received. With an
+   admissible heuristic the solution is then optimal.
+
+   The path to the goal is rebuilt by following parent keys back
+   through the owners' tables.
+
+   Works with any StateSpace subclass whose states can be pickled. Keys
+   are assigned to workers by the 64-bit hash used by closed_list.py,
+   which is the same in every process (unlike hash() of a string under
+   the spawn start method). The goal and heuristic functions must be
+   defined at the top level of a module.
+'''
+import copy
+import heapq
+import itertools
+import multiprocessing
+import queue
+import time
+from collections import namedtuple
+from search import *
+from closed_list import _record_key
+
+#Number of nodes a worker expands between checks of its inbox.
+_EXPANSIONS_PER_ROUND = 100
+
+#The result of hda_star: the goal state found (or False), its cost,
+#whether the search finished (so the cost is optimal for an admissible
+#heuristic) rather than stopping at the timebound, the wall-clock
+#seconds taken, and the number of nodes expanded and states generated
+#by each worker.
+ParallelResult = namedtuple('ParallelResult', ['state', 'cost', 'optimal', 'elapsed', 'expanded', 'generated'])
+
+def _owner(key, workers):
+    '''The worker that owns states with this key'''
+    return _record_key(key) % workers
+
+def _hda_worker(wid, inboxes, master, goal_fn, heur_fn):
+    '''Worker process wid of hda_star'''
+    workers = len(inboxes)
+    inbox = inboxes[wid]
+    table = dict()    #key -> (gval, state, parent key)
+    heap = []         #(fval, -gval, tiebreak, key)
+    tiebreak = itertools.count()
+    outbox = [[] for _ in range(workers)]
+    incumbent = float("inf")
+    sent = 0
+    received = 0
+    expanded = 0
+    generated = 0
+
+    def add(state, key, gval, parent_key):
+        entry = table.get(key)
+        if entry is not None and entry[0] <= gval:
+            return
+        table[key] = (gval, state, parent_key)
+        fval = gval + heur_fn(state)
+        if fval < incumbent:
+            heapq.heappush(heap, (fval, -gval, next(tiebreak), key))
+
+    while True:
+        #read all waiting messages; if there is nothing to expand wait for one
+        block = not heap or heap[0][0] >= incumbent
+        try:
+            while True:
+                msg = inbox.get(timeout=0.05) if block else inbox.get_nowait()
+                block = False
+                kind = msg[0]
+                if kind == 'states':
+                    received = received + 1
+                    for state, gval, parent_key in msg[1]:
+                        add(state, state.hashable_state(), gval, parent_key)
+                elif kind == 'incumbent':
+                    incumbent = min(incumbent, msg[1])
+                elif kind == 'probe':
+                    idle = not heap or heap[0][0] >= incumbent
+                    master.put(('probe', wid, msg[1], idle, sent, received))
+                elif kind == 'trace':
+                    gval, state, parent_key = table[msg[1]]
+                    master.put(('trace', msg[1], state, parent_key))
+                elif kind == 'stop':
+                    master.put(('done', wid, expanded, generated))
+                    #messages still queued for stopped workers can be dropped
+                    for q in inboxes:
+                        q.cancel_join_thread()
+                    return
+        except queue.Empty:
+            pass
+
+        for _ in range(_EXPANSIONS_PER_ROUND):
+            if not heap or heap[0][0] >= incumbent:
+                break
+            fval, neg_gval, _, key = heapq.heappop(heap)
+            gval, state, parent_key = table[key]
+            if gval != -neg_gval:
+                #a cheaper path to this state was found after this entry was pushed
+                continue
+            if goal_fn(state):
+                if gval < incumbent:
+                    incumbent = gval
+                    master.put(('goal', wid, key, gval))
+                continue
+
+            expanded = expanded + 1
+            for succ in state.successors():
+                generated = generated + 1
+                #parents are found through the tables, so don't keep the link
+                succ.parent = None
+                succ_key = succ.hashable_state()
+                owner = _owner(succ_key, workers)
+                if owner == wid:
+                    add(succ, succ_key, succ.gval, key)
+                else:
+                    outbox[owner].append((succ, succ.gval, key))
+
+        for i in range(workers):
+            if outbox[i]:
+                inboxes[i].put(('states', outbox[i]))
+                sent = sent + 1
+                outbox[i] = []
+
+def hda_star(init_state, goal_fn, heur_fn, workers=4, timebound=10):
+    '''Search for a cheapest path from init_state to a goal with hash
+       distributed A* on the given number of worker processes.
+
+       @param init_state: the initial state.
+       @param goal_fn: the goal function (a top level function).
+       @param heur_fn: the heuristic function (a top level function).
+       @param workers: the number of worker processes.
+       @param timebound: wall-clock seconds after which the search stops
+              and returns the best solution found so far, if any.
+       @return: a ParallelResult. Its state is linked to its parents
+              back to a copy of init_state, so print_path can be used.
+    '''
+    start = time.monotonic()
+    stop_time = start + timebound
+    inboxes = [multiprocessing.Queue() for _ in range(workers)]
+    master = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=_hda_worker, args=(i, inboxes, master, goal_fn, heur_fn))
+                 for i in range(workers)]
+    for p in processes:
+        p.daemon = True
+        p.start()
+
+    root = copy.copy(init_state)
+    root.parent = None
+    root_key = root.hashable_state()
+    inboxes[_owner(root_key, workers)].put(('states', [(root, root.gval, None)]))
+    master_sent = 1
+
+    incumbent = float("inf")
+    goal_key = None
+    probe_round = 0
+    replies = dict()
+    last_round = None
+    finished = False
+
+    while time.monotonic() < stop_time:
+        if not replies and probe_round == 0 or len(replies) == workers:
+            if len(replies) == workers:
+                idle = all(r[0] for r in replies.values())
+                counts = tuple(replies[i][1:] for i in range(workers))
+                total_sent = master_sent + sum(c[0] for c in counts)
+                total_received = sum(c[1] for c in counts)
+                if idle and total_sent == total_received and counts == last_round:
+                    finished = True
+                    break
+                last_round = counts if idle else None
+                time.sleep(0.005)
+            probe_round = probe_round + 1
+            replies = dict()
+            for q in inboxes:
+                q.put(('probe', probe_round))
+        try:
+            msg = master.get(timeout=0.05)
+        except queue.Empty:
+            continue
+        kind = msg[0]
+        if kind == 'goal':
+            if msg[3] < incumbent:
+                incumbent = msg[3]
+                goal_key = msg[2]
+                for q in inboxes:
+                    q.put(('incumbent', incumbent))
+        elif kind == 'probe' and msg[2] == probe_round:
+            replies[msg[1]] = msg[3:]
+
+    result_state = False
+    if goal_key is not None:
+        #follow the parent keys back to the initial state
+        path = []
+        key = goal_key
+        while key is not None:
+            inboxes[_owner(key, workers)].put(('trace', key))
+            while True:
+                msg = master.get()
+                if msg[0] == 'trace' and msg[1] == key:
+                    break
+            path.append(msg[2])
+            key = msg[3]
+        path.reverse()
+        for i in range(1, len(path)):
+            path[i].parent = path[i - 1]
+        result_state = path[-1]
+
+    for q in inboxes:
+        q.put(('stop',))
+    expanded = [0] * workers
+    generated = [0] * workers
+    done = 0
+    while done < workers:
+        try:
+            msg = master.get(timeout=5)
+        except queue.Empty:
+            break
+        if msg[0] == 'done':
+            expanded[msg[1]] = msg[2]
+            generated[msg[1]] = msg[3]
+            done = done + 1
+    for p in processes:
+        p.join(timeout=5)
+        if p.is_alive():
+            p.terminate()
+
+    cost = result_state.gval if result_state else None
+    return ParallelResult(result_state, cost, finished, time.monotonic() - start, expanded, generated)
+
+def scaling_report(init_state, goal_fn, heur_fn, worker_counts=(1, 2, 4, 8), timebound=60):
+    '''Solve init_state with hda_star using each number of workers in
+       worker_counts, print how the wall-clock time and the number of
+       expansions change, and return the list of ParallelResults. Speedup
+       is relative to the first entry of worker_counts.'''
+    results = []
+    print("{:>7} {:>6} {:>8} {:>8} {:>10} {:>10}".format("workers", "cost", "optimal", "time", "speedup", "expanded"))
+    for workers in worker_counts:
+        result = hda_star(init_state, goal_fn, heur_fn, workers, timebound)
+        results.append(result)
+        speedup = results[0].elapsed / result.elapsed if result.elapsed > 0 else float("inf")
+        print("{:>7} {:>6} {:>8} {:>8.2f} {:>10.2f} {:>10}".format(
+            workers, str(result.cost), str(result.optimal), result.elapsed, speedup, sum(result.expanded)))
+    return results
+
+if __name__ == "__main__":
+    from sokoban import PROBLEMS, sokoban_goal_state
+    from solution import heur_manhattan_distance
+
+    worker_counts = [1, 2, 4, 8]
+    if multiprocessing.cpu_count() > 8:
+        worker_counts.append(multiprocessing.cpu_count())
+    for i in (3, 4, 8):
+        print("*************************************")
+        print("PROBLEM {}".format(i))
+        scaling_report(PROBLEMS[i], sokoban_goal_state, heur_manhattan_distance, worker_counts)
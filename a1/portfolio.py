@@ -0,0 +1,206 @@
+'''Portfolio search.
+
+   Runs several SearchEngine configurations on the same problem at the
+   same time, one per worker process, and returns either the first
+   solution found or the cheapest solution found before the deadline.
+
+   A configuration (class PortfolioConfig) gives the search strategy,
+   the cycle check level, the heuristic, and optionally a weight for a
+   custom f-value function of the form fval_function(sN, weight) (e.g.,
+   solution.fval_function). Functions are sent to the worker processes
+   by pickling, so heuristics, goal functions and f-value functions
+   must be defined at the top level of a module (no lambdas).
+
+   Solutions are sent back from the workers as the list of states on
+   the path, with the parent links removed; run_portfolio links them
+   up again so the returned goal state can be used with print_path.
+'''
+import copy
+import functools
+import multiprocessing
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from search import *
+
+class PortfolioConfig(namedtuple('PortfolioConfig',
+                                 ['strategy', 'cc_level', 'heur_fn', 'fval_function', 'weight', 'prune_on'])):
+    '''One search configuration of a portfolio.
+       strategy, cc_level === as for SearchEngine
+       heur_fn === the heuristic function
+       fval_function, weight === for the 'custom' strategy, the f-value of
+              a node is fval_function(sN, weight)
+       prune_on === how later solutions are bounded when looking for the
+              best solution (see SearchEngine.iter_solutions)'''
+
+    def __new__(cls, strategy, cc_level='default', heur_fn=None, fval_function=None, weight=1.,
+                prune_on='gval'):
+        return super(PortfolioConfig, cls).__new__(cls, strategy, cc_level, heur_fn, fval_function,
+                                                   weight, prune_on)
+
+#The result of run_portfolio: the goal state found (or False), its cost,
+#the configuration that found it, and one PortfolioRun per configuration.
+PortfolioResult = namedtuple('PortfolioResult', ['state', 'cost', 'config', 'runs'])
+
+#The outcome of one configuration: its cost (None if it found no
+#solution), the wall-clock seconds when its solution was found, and its
+#SearchStats as a dictionary (None if it was cancelled before starting).
+PortfolioRun = namedtuple('PortfolioRun', ['config', 'cost', 'elapsed', 'stats'])
+
+def detach_path(state):
+    '''Return the states on the path to state, starting with the initial
+       state, as copies without parent links (so they can be pickled
+       without recursing down the whole path)'''
+    states = []
+    s = state
+    while s:
+        detached = copy.copy(s)
+        detached.parent = None
+        states.append(detached)
+        s = s.parent
+    states.reverse()
+    return states
+
+def attach_path(states):
+    '''Link up a list of states returned by detach_path, returning the last one'''
+    for i in range(1, len(states)):
+        states[i].parent = states[i - 1]
+    return states[-1]
+
+#Set in each worker process by _init_worker: when set, the worker's
+#search stops.
+_stop_event = None
+
+def _init_worker(event):
+    global _stop_event
+    _stop_event = event
+
+def _run_config(config, init_state, goal_fn, deadline, first):
+    '''Run one configuration in a worker process until deadline (a
+       time.monotonic() time, which is the same in every process).
+       Returns (path, cost, elapsed, stats), with path None if no solution
+       was found and stats None if the deadline had already passed.'''
+    start = time.monotonic()
+    timebound = deadline - start
+    if timebound <= 0:
+        return None, None, None, None
+    se = SearchEngine(config.strategy, config.cc_level)
+    se.set_verbose(False)
+    se.set_budget(wallclock=timebound)
+    se.set_stop_event(_stop_event)
+    kwargs = dict()
+    if config.heur_fn is not None:
+        kwargs['heur_fn'] = config.heur_fn
+    if config.fval_function is not None:
+        kwargs['fval_function'] = functools.partial(config.fval_function, weight=config.weight)
+    se.init_search(init_state, goal_fn, **kwargs)
+
+    best = None
+    elapsed = None
+    if first:
+        goal = se.search(timebound)
+        if goal:
+            best = goal
+            elapsed = time.monotonic() - start
+    else:
+        for solution in se.iter_solutions(timebound, prune_on=config.prune_on):
+            best = solution.state
+            elapsed = time.monotonic() - start
+
+    if best is None:
+        return None, None, None, se.stats.as_dict()
+    return detach_path(best), best.gval, elapsed, se.stats.as_dict()
+
+def run_portfolio(init_state, goal_fn, configs, timebound=10, first=False, max_workers=None):
+    '''Search for a solution from init_state with each of configs in
+       parallel, one configuration per worker process.
+
+       @param init_state: the initial state.
+       @param goal_fn: the goal function (a top level function).
+       @param configs: a list of PortfolioConfig.
+       @param timebound: wall-clock seconds for the whole run, after which
+              all workers stop (configurations that have not started by
+              then are cancelled).
+       @param first: if True, return as soon as any configuration finds a
+              solution and cancel the others. Otherwise each configuration
+              searches for cheaper solutions until the deadline (or until
+              its search space is exhausted) and the cheapest is returned.
+       @param max_workers: number of worker processes (default: one per
+              configuration, at most the number of CPUs).
+       @return: a PortfolioResult.
+    '''
+    if max_workers is None:
+        max_workers = min(len(configs), multiprocessing.cpu_count())
+    deadline = time.monotonic() + timebound
+    stop_event = multiprocessing.Event()
+    runs = [PortfolioRun(config, None, None, None) for config in configs]
+    best_path = None
+    best_cost = float("inf")
+    best_config = None
+
+    executor = ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                   initargs=(stop_event,))
+    try:
+        futures = dict()
+        for i, config in enumerate(configs):
+            futures[executor.submit(_run_config, config, init_state, goal_fn, deadline, first)] = i
+        pending = set(futures)
+        while pending:
+            #once stopped, wait for the running searches to return
+            timeout = None if stop_event.is_set() else max(deadline - time.monotonic(), 0)
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                i = futures[future]
+                if future.cancelled():
+                    continue
+                path, cost, elapsed, stats = future.result()
+                runs[i] = PortfolioRun(configs[i], cost, elapsed, stats)
+                if path is not None and cost < best_cost:
+                    best_path, best_cost, best_config = path, cost, configs[i]
+            if pending and not stop_event.is_set() and ((first and best_path is not None) or
+                                                        time.monotonic() >= deadline):
+                #a solution has been found (or time is up): stop the running
+                #searches and drop the configurations that have not started
+                stop_event.set()
+                for future in pending:
+                    future.cancel()
+    finally:
+        stop_event.set()
+        executor.shutdown(wait=True, cancel_futures=True)
+
+    if best_path is None:
+        return PortfolioResult(False, None, None, runs)
+    return PortfolioResult(attach_path(best_path), best_cost, best_config, runs)
+
+if __name__ == "__main__":
+    from sokoban import PROBLEMS, sokoban_goal_state
+    from solution import heur_displaced, heur_manhattan_distance, heur_alternate, fval_function
+
+    configs = [PortfolioConfig('best_first', 'full', heur_alternate),
+               PortfolioConfig('best_first', 'full', heur_manhattan_distance),
+               PortfolioConfig('astar', 'full', heur_manhattan_distance, prune_on='fval'),
+               PortfolioConfig('astar', 'full', heur_alternate, prune_on='fval')]
+    for weight in (2., 5., 10.):
+        configs.append(PortfolioConfig('custom', 'full', heur_alternate, fval_function, weight, 'fval'))
+        configs.append(PortfolioConfig('custom', 'full', heur_manhattan_distance, fval_function, weight, 'fval'))
+
+    timebound = 8
+    solved = 0; unsolved = []
+    for i in range(0, 10):
+        print("*************************************")
+        print("PROBLEM {}".format(i))
+        result = run_portfolio(PROBLEMS[i], sokoban_goal_state, configs, timebound)
+        if result.state:
+            solved += 1
+            print("Best cost {} found by {} ({} with weight {})".format(
+                result.cost, result.config.strategy, result.config.heur_fn.__name__, result.config.weight))
+        else:
+            unsolved.append(i)
+        for run in result.runs:
+            print("   {} {} weight {}: cost {}".format(run.config.strategy, run.config.heur_fn.__name__,
+                                                     run.config.weight, run.cost))
+
+    print("*************************************")
+    print("{} of 10 problems solved by the portfolio in {} seconds.".format(solved, timebound))
+    print("Problems that remain unsolved in the set are Problems: {}".format(unsolved))
+    print("*************************************")
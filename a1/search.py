@@ -36,14 +36,40 @@
       search (using the init_search method) and resume the search after
       a goal is found (using searchOpen). See the implementation for details. 
 
+    C) Search event sinks
+
+      A sink receives the events of a search: on_expand, on_generate,
+      on_prune (with its cause) and on_goal. Sinks are added with
+      SearchEngine.add_sink; JsonLinesSink, RingBufferSink and
+      CounterSink are provided, and tracing (trace_on) is done by a
+      TraceSink. Every strategy sends events. Searches of OPEN with no
+      sinks and tracing off run a loop without any event or trace code.
+
     '''
+import copy
+import gzip
 import heapq
-from collections import deque
+import itertools
+from array import array
+import json
+import pickle
+from collections import Counter, deque, namedtuple, OrderedDict
 import os
+import time
+try:
+    import resource
+except ImportError:
+    resource = None
 
 class StateSpace:
     '''Abstract class for defining State spaces for search routines'''
-    n = 0
+    #Subclasses that also define __slots__ (as SokobanState does) have no
+    #per-instance __dict__, which makes each state considerably smaller.
+    __slots__ = ('action', 'gval', 'parent', 'index')
+
+    #source of state index numbers (used for tracing). next() on an
+    #itertools.count is atomic, so states can be created from several threads.
+    _index = itertools.count()
     
     def __init__(self, action, gval, parent):
         '''Problem specific state space objects must always include the data items
@@ -58,8 +84,7 @@ class StateSpace:
         self.action = action
         self.gval = gval
         self.parent = parent
-        self.index = StateSpace.n
-        StateSpace.n = StateSpace.n + 1
+        self.index = next(StateSpace._index)
 
     def successors(self):
         '''This method when invoked on a state space object must return a
@@ -77,6 +102,14 @@ class StateSpace:
            if and only if obj1 and obj2 represent the same problem state.'''
         raise Exception("Must be overridden in subclass.")
 
+    def heuristic_key(self):
+        '''Return a hashable key under which a heuristic value of the state
+           may be cached (see HeuristicCache). States with equal keys must
+           have equal heuristic values. By default this is hashable_state();
+           override it when hashable_state() merges states whose heuristic
+           values can differ.'''
+        return self.hashable_state()
+
     def print_state(self):
         '''Print a representation of the state'''
         raise Exception("Must be overridden in subclass.")
@@ -112,14 +145,12 @@ _BEST_FIRST = 2
 _ASTAR = 3
 _UCS = 4
 _CUSTOM = 5
-
-#For best first and astar we use a priority queue. This requires
-#a comparison function for nodes. These constants indicate if we use
-#the gval, the hval or the sum of gval and hval in the comparison.
-_SUM_HG = 0
-_H = 1
-_G = 2
-_C = 3
+_IDA_STAR = 6
+_BEAM = 7
+_BEAM_STACK = 8
+_FOCAL = 9
+_RBFS = 10
+_SMA_STAR = 11
 
 #Cycle Checking. Either CC_NONE 'none' (no cycle checking), CC_PATH
 #'path' (path checking only) or CC_FULL 'full' (full cycle checking,
@@ -128,6 +159,9 @@ _CC_NONE = 0
 _CC_PATH = 1
 _CC_FULL = 2
 
+#Entries of the cycle check dictionary written per pickle by checkpoint
+_CHECKPOINT_CHUNK = 65536
+
 #Zero Heuristic Function---for uninformed search don't include heur_fn
 #in call to search engine's search method, defaults heur_fn to the zero fn.
 def _zero_hfn(state):
@@ -138,108 +172,642 @@ def _fval_function(state):
   '''default fval function results in Best First Search'''  
   return state.hval 
 
+#Solutions reported by SearchEngine.iter_solutions: the goal state, its
+#cost (gval), and the search time in seconds when it was found.
+Solution = namedtuple('Solution', ['state', 'cost', 'elapsed'])
+
+class SearchStats:
+    '''Statistics of a search, kept by SearchEngine as self.stats. The
+       counters are reset by init_search and accumulate over the calls
+       to search (or iter_solutions) that follow it.
+       a) nodes === search nodes created (the "Nodes expanded" figure
+          printed by search)
+       b) expanded === nodes whose successors were generated, and
+          generated === states generated (including the initial state)
+       c) cycle_check_pruned, cost_bound_pruned, stale_pruned (nodes
+          taken from OPEN after a cheaper path to their state had been
+          expanded), f_bound_pruned (successors over the IDA* bound, and
+          RBFS subtrees dropped over their f limit) and
+          forgotten_pruned (leaves forgotten by SMA*)
+       d) peak_open === largest size of OPEN, cc_size === size of the
+          cycle check dictionary at the end of the search
+       e) successor_time, heuristic_time and open_time === seconds
+          spent in successors(), in heur_fn and in OPEN inserts/extracts
+       f) elapsed === CPU seconds (os.times) and wall_time === wall-clock
+          seconds spent searching
+       g) heuristic_cache_hits and heuristic_cache_misses === lookups in
+          the heuristic cache, if one is used (see set_heuristic_cache)'''
+
+    def __init__(self):
+        self.nodes = 0
+        self.expanded = 0
+        self.generated = 0
+        self.cycle_check_pruned = 0
+        self.cost_bound_pruned = 0
+        self.stale_pruned = 0
+        self.f_bound_pruned = 0
+        self.forgotten_pruned = 0
+        self.peak_open = 0
+        self.cc_size = 0
+        self.successor_time = 0.0
+        self.heuristic_time = 0.0
+        self.open_time = 0.0
+        self.elapsed = 0.0
+        self.wall_time = 0.0
+        self.heuristic_cache_hits = 0
+        self.heuristic_cache_misses = 0
+
+    def expansions_per_sec(self):
+        '''Expansions per wall-clock second'''
+        if self.wall_time <= 0:
+            return 0.0
+        return self.expanded / self.wall_time
+
+    def heuristic_cache_hit_rate(self):
+        '''Fraction of heuristic cache lookups that were hits'''
+        lookups = self.heuristic_cache_hits + self.heuristic_cache_misses
+        if lookups == 0:
+            return 0.0
+        return self.heuristic_cache_hits / lookups
+
+    def pruned(self):
+        '''Number of states pruned, by cause'''
+        return {'cycle_check': self.cycle_check_pruned,
+                'cost_bound': self.cost_bound_pruned,
+                'stale': self.stale_pruned,
+                'f_bound': self.f_bound_pruned,
+                'forgotten': self.forgotten_pruned}
+
+    def as_dict(self):
+        '''Return the statistics as a dictionary (for JSON export)'''
+        return {'nodes': self.nodes,
+                'expanded': self.expanded,
+                'generated': self.generated,
+                'pruned': self.pruned(),
+                'peak_open': self.peak_open,
+                'cc_size': self.cc_size,
+                'successor_time': self.successor_time,
+                'heuristic_time': self.heuristic_time,
+                'open_time': self.open_time,
+                'elapsed': self.elapsed,
+                'wall_time': self.wall_time,
+                'expansions_per_sec': self.expansions_per_sec(),
+                'heuristic_cache': {'hits': self.heuristic_cache_hits,
+                                    'misses': self.heuristic_cache_misses,
+                                    'hit_rate': self.heuristic_cache_hit_rate()}}
+
+    def to_json(self, **kwargs):
+        '''Return the statistics as a JSON string. kwargs are passed to json.dumps.'''
+        return json.dumps(self.as_dict(), **kwargs)
+
+    def __repr__(self):
+        return "SearchStats({})".format(self.as_dict())
+
+class HeuristicCache:
+    '''Wraps a heuristic function with a least recently used cache of
+       its values, keyed by heuristic_key(). Equal states reached along
+       different paths are then only scored once (while they stay in the
+       cache). At most size values are kept.'''
+
+    def __init__(self, heur_fn, size):
+        self.heur_fn = heur_fn
+        self.size = size
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, state):
+        key = state.heuristic_key()
+        cache = self.cache
+        if key in cache:
+            self.hits = self.hits + 1
+            cache.move_to_end(key)
+            return cache[key]
+        self.misses = self.misses + 1
+        hval = self.heur_fn(state)
+        cache[key] = hval
+        if len(cache) > self.size:
+            cache.popitem(last=False)
+        return hval
+
+class BudgetExhausted:
+    '''Returned by SearchEngine.search when the search stops because a
+       budget (see SearchEngine.set_budget) or the timebound ran out.
+       It evaluates as False, like a failed search, and records
+       a) reason === which budget ran out: 'time', 'wallclock',
+          'expanded', 'generated', 'open' or 'memory', or 'cancelled'
+          if the engine's stop event was set
+       b) best_state === the expanded state with the lowest hval (the
+          most promising partial result), and best_hval its hval
+       c) expanded, generated, open_size, peak_open, memory and
+          elapsed (CPU seconds) === the state of the search when it stopped
+       d) stats === the engine's SearchStats'''
+
+    def __init__(self, reason, best_state, best_hval, expanded, generated, open_size, peak_open, memory, elapsed, stats=None):
+        self.reason = reason
+        self.stats = stats
+        self.best_state = best_state
+        self.best_hval = best_hval
+        self.expanded = expanded
+        self.generated = generated
+        self.open_size = open_size
+        self.peak_open = peak_open
+        self.memory = memory
+        self.elapsed = elapsed
+
+    def __bool__(self): return False
+
+    def __repr__(self):
+        return "BudgetExhausted(reason={}, best_hval={}, expanded={}, generated={}, open_size={})".format(
+            self.reason, self.best_hval, self.expanded, self.generated, self.open_size)
+
+class SearchSink:
+    '''Base class of search event sinks (see SearchEngine.add_sink). The
+       methods do nothing; subclasses override the events they need.
+       a) on_expand(node, successors) === node is being expanded and
+          successors are the states it generated
+       b) on_generate(node) === node was added to OPEN
+       c) on_prune(state, cause) === a state was dropped; cause is
+          'cycle_check', 'cost_bound', 'stale' (a node taken from OPEN
+          after a cheaper path to its state had been expanded), 'f_bound'
+          (over the bound of an ida_star iteration, or an rbfs node whose
+          best child is over its f limit, so its subtree is dropped and
+          its backed up f-value returned to its parent) or 'forgotten' (a
+          leaf dropped by sma_star to stay within its node limit)
+       d) on_goal(node) === node is the goal returned by the search'''
+
+    def on_expand(self, node, successors): pass
+
+    def on_generate(self, node): pass
+
+    def on_prune(self, state, cause): pass
+
+    def on_goal(self, node): pass
+
+    def close(self): pass
+
+class SinkGroup(SearchSink):
+    '''Passes each event on to several sinks'''
+
+    def __init__(self, sinks):
+        self.sinks = list(sinks)
+
+    def on_expand(self, node, successors):
+        for sink in self.sinks:
+            sink.on_expand(node, successors)
+
+    def on_generate(self, node):
+        for sink in self.sinks:
+            sink.on_generate(node)
+
+    def on_prune(self, state, cause):
+        for sink in self.sinks:
+            sink.on_prune(state, cause)
+
+    def on_goal(self, node):
+        for sink in self.sinks:
+            sink.on_goal(node)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+class RecordSink(SearchSink):
+    '''Base class of sinks that store each event as a dictionary, e.g.
+       {'event': 'generate', 'node': 12, 'parent': 3, 'state': 40,
+        'action': 'up', 'key': ..., 'g': 4, 'h': 7}. Subclasses define
+       record(event).'''
+
+    def record(self, event): pass
+
+    def _node_event(self, kind, node):
+        state = node.state
+        return {'event': kind, 'node': node.index, 'state': state.index,
+                'action': state.action, 'key': state.hashable_state(),
+                'g': node.gval, 'h': node.hval}
+
+    def on_expand(self, node, successors):
+        event = self._node_event('expand', node)
+        event['successors'] = len(successors)
+        self.record(event)
+
+    def on_generate(self, node):
+        self.record(self._node_event('generate', node))
+
+    def on_prune(self, state, cause):
+        self.record({'event': 'prune', 'cause': cause, 'state': state.index,
+                     'action': state.action, 'key': state.hashable_state(), 'g': state.gval})
+
+    def on_goal(self, node):
+        self.record(self._node_event('goal', node))
+
+class JsonLinesSink(RecordSink):
+    '''Writes each event as a line of JSON to a file (a path or an open
+       file). Keys that are not JSON types are written as strings.'''
+
+    def __init__(self, file):
+        self.own_file = isinstance(file, str)
+        self.file = open(file, 'w') if self.own_file else file
+
+    def record(self, event):
+        self.file.write(json.dumps(event, default=str))
+        self.file.write("\n")
+
+    def close(self):
+        if self.own_file:
+            self.file.close()
+        else:
+            self.file.flush()
+
+class RingBufferSink(RecordSink):
+    '''Keeps the last size events (as dictionaries) in self.events'''
+
+    def __init__(self, size=1000):
+        self.events = deque(maxlen=size)
+
+    def record(self, event):
+        self.events.append(event)
+
+class CounterSink(SearchSink):
+    '''Counts the events, and the prunes by cause, in self.counts'''
+
+    def __init__(self):
+        self.counts = Counter()
+
+    def on_expand(self, node, successors):
+        self.counts['expand'] += 1
+
+    def on_generate(self, node):
+        self.counts['generate'] += 1
+
+    def on_prune(self, state, cause):
+        self.counts['prune'] += 1
+        self.counts['prune_' + cause] += 1
+
+    def on_goal(self, node):
+        self.counts['goal'] += 1
+
+class TraceSink(SearchSink):
+    '''Prints a trace of the search (used by SearchEngine.trace_on).
+       Level 1 traces expansions, level 2 also every successor.'''
+
+    def __init__(self, level=1):
+        self.level = level
+
+    def on_expand(self, node, successors):
+        print("   TRACE: Next State to expand: <S{}:{}:{}, g={}, h={}, f=g+h={}>".format(
+            node.state.index, node.state.action, node.state.hashable_state(), node.gval, node.hval, node.gval + node.hval))
+        if node.state.gval != node.gval:
+            print("ERROR: Node gval not equal to state gval!")
+        print("   TRACE: Expanding Node. Successors = {", end="")
+        for ss in successors:
+            print("<S{}:{}:{}, g={}>, ".format(ss.index, ss.action, ss.hashable_state(), ss.gval), end="")
+        print("}")
+
+    def on_generate(self, node):
+        if self.level > 1:
+            print("   TRACE: Successor State:", end="")
+            node.state.print_state()
+            print("   TRACE: Heuristic Value:", node.hval)
+            print(" TRACE: Successor State added to OPEN")
+            print("\n")
+
+    def on_prune(self, state, cause):
+        if cause == 'stale':
+            print("   TRACE: State already expanded with a lower gval, not expanded again")
+        elif self.level > 1:
+            print("   TRACE: Successor State:", end="")
+            state.print_state()
+            if cause == 'cycle_check':
+                print(" TRACE: Successor State pruned by cycle checking")
+            elif cause == 'f_bound':
+                print(" TRACE: State pruned, over the f bound")
+            elif cause == 'forgotten':
+                print(" TRACE: State forgotten to stay within the node limit")
+            else:
+                print(" TRACE: Successor State pruned, over current cost bound")
+            print("\n")
+
+    def on_goal(self, node):
+        print("   TRACE: Goal found: <S{}:{}:{}, g={}>".format(
+            node.state.index, node.state.action, node.state.hashable_state(), node.gval))
+
+def _memory_usage():
+    '''Approximate memory used by this process in bytes: the current
+       resident set size where /proc is available, otherwise the peak
+       resident set size.'''
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError, AttributeError):
+        pass
+    if resource is not None:
+        #ru_maxrss is in kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return 0
+
 class sNode:
     '''Object of this class form the nodes of the search space.  Each
     node consists of a search space object (determined by the problem
     definition) along with the h and g values (the g values is
     redundant as it is stored in the state, but we make a copy in the
-    node object for convenience), and the number of the node'''
+    node object for convenience), the number of the node and its depth
+    (the number of actions from the initial state). Node
+    numbers are assigned by the SearchEngine that creates the node and
+    are used to break ties on OPEN. Nodes are kept small: they use
+    __slots__, and the f-value function is held by Open rather than by
+    each node (the fval_function argument is accepted for compatibility
+    and ignored).'''
+
+    __slots__ = ('state', 'hval', 'gval', 'index', 'depth')
     
-    n = 0
-    lt_type = _SUM_HG
-    
-    def __init__(self, state, hval, fval_function):
+    def __init__(self, state, hval, fval_function=None, index=0, depth=0):
         self.state = state
         self.hval = hval
         self.gval = state.gval
-        self.index = sNode.n
-        self.fval_function = fval_function
-        sNode.n = sNode.n + 1
-
-    def __lt__(self, other):
-        '''For astar and best first we muse a priority queue for the
-           OPEN set. This queue stores search nodes waiting to be
-           expanded. Thus we need to define a node1 < node2 function
-           by defining the __lt__ function. Dependent on the type of
-           search this comparison function compares the h-value, the
-           g-value or the f-value of the nodes. Note for the f-value
-           we wish to break ties by letting node1 < node2 if they both
-           have identical f-values but if node1 has a GREATER g
-           value. This means that we expand nodes along deeper paths
-           first causing the search to proceed directly to the goal'''
-                
-        if sNode.lt_type == _SUM_HG:
-            if (self.gval+self.hval) == (other.gval+other.hval):
-                #break ties by greatest gval. 
-                return self.gval > other.gval
-            else: return ((self.gval+self.hval) < (other.gval+other.hval))
-        if sNode.lt_type == _G:
-            return self.gval < other.gval
-        if sNode.lt_type == _H:
-            return self.hval < other.hval    
-        if sNode.lt_type == _C:  
-            return self.fval_function(self) <  other.fval_function(other)          
-        
-        print('sNode class has invalid comparator setting!')
-        
-        #return default of lowest gval (generating UCS behavior)
-        return self.gval < other.gval
+        self.index = index
+        self.depth = depth
+
+class IndexedHeap:
+    '''A binary heap of OPEN entries that holds at most one entry per
+       state. Entries are indexed by the hashable_state() key of their
+       state, so when a cheaper path to a state already on the heap is
+       found the existing entry is replaced and moved up the heap
+       (decrease-key) instead of a second entry being pushed. Entries
+       are the priority tuples built by Open and are compared as tuples.'''
+
+    def __init__(self):
+        self.heap = []
+        self.keys = []
+        self.position = dict()
+
+    def __len__(self): return len(self.heap)
+
+    def __getitem__(self, i): return self.heap[i]
+
+    def __iter__(self): return iter(self.heap)
+
+    def push(self, entry, key):
+        '''Insert entry for the state with the given key. If the state is
+           already on the heap, the new entry replaces the old one if its
+           node has a lower gval (a cheaper path to the state), or else if
+           it is the smaller entry. The priority need not include gval
+           (e.g., best_first), so a replaced entry may move either way.'''
+        i = self.position.get(key)
+        if i is None:
+            self.heap.append(entry)
+            self.keys.append(key)
+            self._sift_up(len(self.heap) - 1)
+            return
+        old = self.heap[i]
+        if entry[-1].gval < old[-1].gval or (entry[-1].gval == old[-1].gval and entry < old):
+            self.heap[i] = entry
+            self._sift_up(i)
+            self._sift_down(self.position[key])
+
+    def pop(self):
+        '''Remove and return the smallest entry.'''
+        heap = self.heap
+        keys = self.keys
+        node = heap[0]
+        del self.position[keys[0]]
+        last_node = heap.pop()
+        last_key = keys.pop()
+        if heap:
+            heap[0] = last_node
+            keys[0] = last_key
+            self._sift_down(0)
+        return node
+
+    def _sift_up(self, i):
+        heap = self.heap
+        keys = self.keys
+        position = self.position
+        node = heap[i]
+        key = keys[i]
+        while i > 0:
+            parent = (i - 1) >> 1
+            if not node < heap[parent]:
+                break
+            heap[i] = heap[parent]
+            keys[i] = keys[parent]
+            position[keys[i]] = i
+            i = parent
+        heap[i] = node
+        keys[i] = key
+        position[key] = i
+
+    def _sift_down(self, i):
+        heap = self.heap
+        keys = self.keys
+        position = self.position
+        size = len(heap)
+        node = heap[i]
+        key = keys[i]
+        while True:
+            child = 2*i + 1
+            if child >= size:
+                break
+            if child + 1 < size and heap[child + 1] < heap[child]:
+                child = child + 1
+            if not heap[child] < node:
+                break
+            heap[i] = heap[child]
+            keys[i] = keys[child]
+            position[keys[i]] = i
+            i = child
+        heap[i] = node
+        keys[i] = key
+        position[key] = i
+
+class FocalQueue:
+    '''OPEN for focal search (A*epsilon). Nodes are ordered by
+       fval = gval+hval, and the FOCAL list holds the nodes on OPEN whose
+       fval is at most weight times the lowest fval on OPEN (f_min).
+       pop returns the FOCAL node with the lowest focal value,
+       focal_fn(state) (hval if focal_fn is None). Each node is kept in
+       two heaps: all nodes by fval, to find f_min, and either the nodes
+       not yet in FOCAL by fval or FOCAL by focal value. Nodes are
+       removed from the heaps lazily, when they reach the top after
+       leaving OPEN; FOCAL entries whose fval has gone above the limit
+       (if f_min fell) are moved back when they reach the top.
+
+       If indexed is True each state is on OPEN at most once (as with
+       IndexedHeap): a node for a state already on OPEN replaces the
+       old one if it is cheaper and is dropped otherwise.'''
+
+    def __init__(self, weight, focal_fn=None, indexed=False):
+        self.weight = weight
+        self.focal_fn = focal_fn
+        self.by_fval = []    #(fval, node number, node)
+        self.pending = []    #(fval, node number, focal value, node)
+        self.focal = []      #(focal value, fval, node number, node)
+        self.alive = set()   #numbers of the nodes on OPEN
+        self.position = dict() if indexed else None   #state key -> its node on OPEN
+
+    def __len__(self): return len(self.alive)
+
+    def __iter__(self):
+        return (entry for entry in self.by_fval if entry[1] in self.alive)
+
+    def push(self, node, key=None):
+        if self.position is not None:
+            old = self.position.get(key)
+            if old is not None:
+                if old.gval <= node.gval:
+                    return
+                self.alive.discard(old.index)
+            self.position[key] = node
+        fval = node.gval + node.hval
+        fvalue = node.hval if self.focal_fn is None else self.focal_fn(node.state)
+        self.alive.add(node.index)
+        heapq.heappush(self.by_fval, (fval, node.index, node))
+        if fval <= self.weight * self.by_fval[0][0]:
+            heapq.heappush(self.focal, (fvalue, fval, node.index, node))
+        else:
+            heapq.heappush(self.pending, (fval, node.index, fvalue, node))
+
+    def pop(self):
+        '''Remove and return the FOCAL node with the lowest focal value.'''
+        by_fval = self.by_fval
+        alive = self.alive
+        while by_fval[0][1] not in alive:
+            heapq.heappop(by_fval)
+        limit = self.weight * by_fval[0][0]
+        #f_min may have risen: move the nodes now within the limit to FOCAL
+        pending = self.pending
+        focal = self.focal
+        while pending and pending[0][0] <= limit:
+            fval, index, fvalue, node = heapq.heappop(pending)
+            if index in alive:
+                heapq.heappush(focal, (fvalue, fval, index, node))
+        while True:
+            fvalue, fval, index, node = heapq.heappop(focal)
+            if index not in alive:
+                continue
+            if fval <= limit:
+                break
+            heapq.heappush(pending, (fval, index, fvalue, node))
+        alive.remove(index)
+        if self.position is not None:
+            del self.position[node.state.hashable_state()]
+        return node
+
+class _SMANode:
+    '''A node in memory in SMA* search: the search node, its backed up
+       f-value, its parent and children in memory (by state key), the
+       lowest f-value of its forgotten children, whether it has been
+       expanded, whether it is on the queue, and a version number that
+       marks out of date queue entries.'''
+    __slots__ = ('node', 'f', 'parent', 'key', 'children', 'forgotten', 'expanded', 'queued', 'version')
+
+    def __init__(self, node, f, parent, key):
+        self.node = node
+        self.f = f
+        self.parent = parent
+        self.key = key
+        self.children = dict()
+        self.forgotten = float("inf")
+        self.expanded = False
+        self.queued = False
+        self.version = 0
 
 class Open:
     '''Open objects hold the search frontier---the set of unexpanded
        nodes. Depending on the search strategy used we want to extract
        nodes from this set in different orders, so set up the object's
        functions to operate as needed by the particular search
-       strategy'''
+       strategy.
+
+       For the priority queue strategies each node is stored in a
+       tuple whose leading items are its priority, computed once when
+       the node is inserted, followed by the node number (so ties are
+       broken first in first out and nodes are never compared) and the
+       node itself. The ordering is private to each Open object, so
+       several searches can run at the same time.
+
+       insert takes the node and, optionally, the hashable_state() key
+       of its state. The key is only used when indexed is True: then
+       the priority queue strategies use an IndexedHeap so that each
+       state is on OPEN at most once.'''
     
-    def __init__(self, search_strategy):
-        if search_strategy == _DEPTH_FIRST:
+    def __init__(self, search_strategy, fval_function=_fval_function, indexed=False, weight=1, focal_fn=None):
+        self.priority_queue = False
+        if search_strategy in (_DEPTH_FIRST, _IDA_STAR, _BEAM, _BEAM_STACK, _RBFS, _SMA_STAR):
             #use stack for OPEN set (last in---most recent successor added---is first out)
+            #IDA* is a sequence of f-bounded depth-first searches so it uses the same stack
+            #beam search keeps the current layer on the stack, best node last
+            #RBFS keeps the frames of the current path on it and SMA* its
+            #priority queue (see _searchRBFS and _searchSMA)
             self.open = []
-            self.insert = self.open.append
+            self.insert = lambda node, key=None: self.open.append(node)
             self.extract = self.open.pop
+            return
         elif search_strategy == _BREADTH_FIRST:
             #use queue for OPEN (first in---earliest node not yet expanded---is first out)
             self.open = deque()
-            self.insert = self.open.append
+            self.insert = lambda node, key=None: self.open.append(node)
             self.extract = self.open.popleft
+            return
         elif search_strategy == _UCS:
             #use priority queue for OPEN (first out is node with lowest gval)
-            self.open = []
-            #set node less than function to compare gvals only
-            sNode.lt_type = _G
-            self.insert = lambda node: heapq.heappush(self.open, node)
-            self.extract = lambda: heapq.heappop(self.open)            
+            priority = lambda node: (node.gval, node.index, node)
         elif search_strategy == _BEST_FIRST:
             #use priority queue for OPEN (first out is node with lowest hval)
-            self.open = []
-            #set node less than function to compare hvals only
-            sNode.lt_type = _H
-            self.insert = lambda node: heapq.heappush(self.open, node)
-            self.extract = lambda: heapq.heappop(self.open)
+            priority = lambda node: (node.hval, node.index, node)
         elif search_strategy == _ASTAR:
             #use priority queue for OPEN (first out is node with lowest fval = gval+hval)
-            self.open = []
-            #set node less than function to compare sums of hval and gval
-            sNode.lt_type = _SUM_HG
-            self.insert = lambda node: heapq.heappush(self.open, node)
-            self.extract = lambda: heapq.heappop(self.open) 
+            #break ties by greatest gval. This means that we expand nodes along
+            #deeper paths first causing the search to proceed directly to the goal
+            priority = lambda node: (node.gval + node.hval, -node.gval, node.index, node)
         elif search_strategy == _CUSTOM:
             #use priority queue for OPEN (first out is node with lowest fval)
-            self.open = []
-            #set node less than function to compare sums of fval    
-            sNode.lt_type = _C
-            self.insert = lambda node: heapq.heappush(self.open, node)
-            self.extract = lambda: heapq.heappop(self.open)          
+            priority = lambda node: (fval_function(node), node.index, node)
+        elif search_strategy == _FOCAL:
+            #use FocalQueue for OPEN (first out is node with lowest focal value
+            #among those with fval within weight times the lowest fval)
+            self.priority_queue = True
+            queue = self.open = FocalQueue(weight, focal_fn, indexed)
+            self.insert = queue.push
+            self.extract = queue.pop
+            return
+
+        self.priority_queue = True
+        if indexed:
+            heap = self.open = IndexedHeap()
+            self.insert = lambda node, key=None: heap.push(priority(node), key)
+            self.extract = lambda: heap.pop()[-1]
+        else:
+            heap = self.open = []
+            heappush = heapq.heappush
+            heappop = heapq.heappop
+            self.insert = lambda node, key=None: heappush(heap, priority(node))
+            self.extract = lambda: heappop(heap)[-1]
 
     def empty(self): return not self.open
 
+    def put_back(self, node):
+        '''Return a node that was just extracted to OPEN, so that it is
+           extracted again in its turn (next, except in priority queues,
+           where newer nodes may come before it)'''
+        if isinstance(self.open, deque):
+            self.open.appendleft(node)
+        else:
+            self.insert(node, node.state.hashable_state())
+
+    def nodes(self):
+        '''Return a list of the nodes on OPEN (in no particular order)'''
+        if self.priority_queue:
+            return [entry[-1] for entry in self.open]
+        return list(self.open)
+
     def print_open(self):
         print("{", end="")
-        if len(self.open) == 1: 
-            print("   <S{}:{}:{}, g={}, h={}, f=g+h={}>".format(self.open[0].state.index, self.open[0].state.action, self.open[0].state.hashable_state(), self.open[0].gval, self.open[0].hval, self.open[0].gval+self.open[0].hval), end="")
+        nodes = self.nodes()
+        if len(nodes) == 1: 
+            print("   <S{}:{}:{}, g={}, h={}, f=g+h={}>".format(nodes[0].state.index, nodes[0].state.action, nodes[0].state.hashable_state(), nodes[0].gval, nodes[0].hval, nodes[0].gval+nodes[0].hval), end="")
         else:
-            for nd in self.open:
+            for nd in nodes:
                 print("   <S{}:{}:{}, g={}, h={}, f=g+h={}>".format(nd.state.index, nd.state.action, nd.state.hashable_state(), nd.gval, nd.hval, nd.gval+nd.hval), end="")
         print("}")
 
@@ -247,32 +815,175 @@ class SearchEngine:
     def __init__(self, strategy = 'depth_first', cc_level = 'default'):
         self.set_strategy(strategy, cc_level)
         self.trace = 0
+        self.sinks = []
+        self.verbose = True
+        self.decrease_key = True
+        self.heuristic_cache_size = None
+        self.heuristic_cache = None
+        self.compact_paths = False
+        self.beam_width = 100
+        self.node_limit = None
+        self.focal_weight = 2
+        self.focal_fn = None
+        self.closed_list = dict
+        self.stop_event = None
+        self.checkpoint_path = None
+        self.checkpoint_every = None
+        self.set_budget()
+        self.stats = SearchStats()
 
     def initStats(self):
-        sNode.n = 0
-        StateSpace.n = 1    #initial state already generated on call so search
-        self.cycle_check_pruned = 0
-        self.cost_bound_pruned = 0
+        #counters are kept on the engine so that separate engines can
+        #search at the same time without mixing up their statistics
+        self.stats = SearchStats()
+        self.stats.generated = 1    #initial state already generated on call so search
+        self.memory = 0
+        self.best_node = None
 
     def trace_on(self, level = 1):
         '''For debugging, set tracking level 1 or 2'''
         self.trace = level
 
+    def add_sink(self, sink):
+        '''Send the events of the searches to sink (a SearchSink).'''
+        self.sinks.append(sink)
+
+    def remove_sink(self, sink):
+        '''Stop sending events to sink'''
+        self.sinks.remove(sink)
+
     def trace_off(self):
         '''Turn off tracing'''
         self.trace = 0
 
+    def set_verbose(self, flag = True):
+        '''Print the result and node counts of each search (the default).
+           If flag is False search runs silently; the counts are still
+           available in self.stats.'''
+        self.verbose = flag
+
+    def set_heuristic_cache(self, size = 100000):
+        '''Cache up to size heuristic values, keyed by heuristic_key(),
+           evicting the least recently used. Takes effect at the next
+           init_search. size None (or 0) turns the cache off (the default).
+           The hit rate is reported in self.stats.'''
+        self.heuristic_cache_size = size
+
+    def set_compact_paths(self, flag = True):
+        '''Store the search tree compactly (takes effect at the next
+           init_search). Instead of each state keeping a reference to its
+           parent, the engine records each node's parent node number and
+           action in two arrays, so expanded states can be freed. The path
+           to a goal is rebuilt on demand by replaying the recorded actions
+           from the initial state, which requires that the successors of
+           a state have distinct actions. Not used with path checking
+           (which follows parent references) or with ida_star (which
+           already stores only the current path).'''
+        self.compact_paths = flag
+
+    def set_beam_width(self, k = 100):
+        '''Set the number of nodes kept in each layer by the beam and
+           beam_stack strategies (default 100).'''
+        self.beam_width = k
+
+    def set_node_limit(self, limit = 100000):
+        '''Limit the number of nodes stored by the rbfs and sma_star
+           strategies. SMA* forgets the least promising leaves to stay
+           within the limit (and uses 100000 if no limit is set); RBFS
+           stops with a BudgetExhausted (reason 'node_limit') if the
+           current path and its siblings need more. None for no limit.'''
+        self.node_limit = limit
+
+    def set_focal(self, weight = 2, focal_fn = None):
+        '''Set the parameters of the focal strategy (A*epsilon), which
+           expands, among the nodes on OPEN whose gval+hval is at most
+           weight times the lowest gval+hval on OPEN, the one with the
+           lowest focal_fn(state), e.g. solution.heur_displaced (the number
+           of boxes not yet stored). focal_fn None uses the heuristic.
+           With an admissible heuristic the solution found costs at most
+           weight times the optimal cost. Takes effect at the next init_search.'''
+        if weight < 1:
+            print('Focal weight must be at least 1:', weight)
+            return
+        self.focal_weight = weight
+        self.focal_fn = focal_fn
+
+    def set_closed_list(self, factory = dict):
+        '''Choose how the cycle check dictionary (the closed list used by
+           full cycle checking) is stored. factory is called with no
+           arguments at each init_search and must return a mapping from
+           hashable_state() keys to g-values supporting in, [], len and
+           items(), e.g. closed_list.SpillingClosedList, which moves to a
+           memory-mapped file on disk once it grows too large. The
+           default is dict.'''
+        self.closed_list = factory
+
+    def set_decrease_key(self, flag = True):
+        '''With full cycle checking, keep each state on OPEN at most once
+           and update its entry in place when a cheaper path is found
+           (the default). If flag is False, push a new node instead and
+           skip the stale ones lazily when they are extracted.'''
+        self.decrease_key = flag
+
+    def set_budget(self, expanded=None, generated=None, open_size=None, memory=None, wallclock=None):
+        '''Limit the resources a search may use, in addition to the CPU
+           timebound given to search. Each limit is None for no limit:
+           expanded === number of nodes expanded
+           generated === number of states generated
+           open_size === peak number of nodes on OPEN
+           memory === approximate memory used by the process, in bytes
+                      (sampled every 1024 expansions)
+           wallclock === wall-clock seconds, measured with a monotonic clock
+           The expanded and generated counts accumulate over the calls to
+           search after init_search; the wallclock budget applies to each
+           call. When a budget runs out search returns a BudgetExhausted.'''
+        self.max_expanded = expanded
+        self.max_generated = generated
+        self.max_open = open_size
+        self.max_memory = memory
+        self.wallclock = wallclock
+        self._set_budgeted()
+
+    def set_stop_event(self, event):
+        '''Stop searching when event (e.g., a threading.Event or a
+           multiprocessing.Event) is set. The event is polled every 64
+           expansions, and search then returns a BudgetExhausted with
+           reason 'cancelled'. None removes the event.'''
+        self.stop_event = event
+        self._set_budgeted()
+
+    def set_checkpoint(self, path=None, every=60):
+        '''Write a checkpoint of the search (see checkpoint) to path every
+           every wall-clock seconds while searching. None turns automatic
+           checkpoints off.'''
+        self.checkpoint_path = path
+        self.checkpoint_every = every
+        self._set_budgeted()
+
+    def _set_budgeted(self):
+        '''Note whether any budget needs checking during the search'''
+        self.budgeted = not (self.max_expanded is None and self.max_generated is None and
+                             self.max_open is None and self.max_memory is None and
+                             self.wallclock is None and self.stop_event is None and
+                             self.checkpoint_path is None)
+
     def set_strategy(self, s, cc = 'default'):
-        if not s in ['depth_first', 'breadth_first', 'ucs', 'best_first', 'astar', 'custom']:
+        if not s in ['depth_first', 'breadth_first', 'ucs', 'best_first', 'astar', 'custom', 'ida_star', 'beam', 'beam_stack', 'focal',
+                     'rbfs', 'sma_star']:
             print('Unknown search strategy specified:', s)
-            print("Must be one of 'depth_first', 'ucs', 'breadth_first', 'best_first', 'custom' or 'astar'")
+            print("Must be one of 'depth_first', 'ucs', 'breadth_first', 'best_first', 'custom', 'astar', 'ida_star', 'beam', 'beam_stack', 'focal', 'rbfs' or 'sma_star'")
         elif not cc in ['default', 'none', 'path', 'full']:
             print('Unknown cycle check level', cc)
             print( "Must be one of ['default', 'none', 'path', 'full']")
+        elif s in ['ida_star', 'rbfs', 'sma_star'] and cc == 'full':
+            #full cycle checking would store every state, defeating the point
+            #of these memory bounded strategies
+            print(s, 'does not support full cycle checking')
+            print( "Must be one of ['default', 'none', 'path']")
 
         else:
             if cc == 'default' :
-                if s == 'depth_first' :
+                if s in ['depth_first', 'ida_star', 'rbfs', 'sma_star']:
                     self.cycle_check = _CC_PATH
                 else:
                     self.cycle_check = _CC_FULL
@@ -286,6 +997,12 @@ class SearchEngine:
             elif s == 'best_first'   : self.strategy = _BEST_FIRST
             elif s == 'astar'        : self.strategy = _ASTAR       
             elif s == 'custom' : self.strategy = _CUSTOM             
+            elif s == 'ida_star'     : self.strategy = _IDA_STAR
+            elif s == 'beam'         : self.strategy = _BEAM
+            elif s == 'beam_stack'   : self.strategy = _BEAM_STACK
+            elif s == 'focal'        : self.strategy = _FOCAL
+            elif s == 'rbfs'         : self.strategy = _RBFS
+            elif s == 'sma_star'     : self.strategy = _SMA_STAR
 
     def get_strategy(self):
         if   self.strategy == _DEPTH_FIRST    : rval = 'depth_first'
@@ -294,6 +1011,12 @@ class SearchEngine:
         elif self.strategy == _UCS          : rval = 'ucs' 
         elif self.strategy == _ASTAR          : rval = 'astar'      
         elif self.strategy == _CUSTOM          : rval = 'custom'   
+        elif self.strategy == _IDA_STAR        : rval = 'ida_star'
+        elif self.strategy == _BEAM            : rval = 'beam'
+        elif self.strategy == _BEAM_STACK      : rval = 'beam_stack'
+        elif self.strategy == _FOCAL           : rval = 'focal'
+        elif self.strategy == _RBFS            : rval = 'rbfs'
+        elif self.strategy == _SMA_STAR        : rval = 'sma_star'
   
         rval = rval + ' with '
 
@@ -303,7 +1026,7 @@ class SearchEngine:
 
         return rval
 
-    def init_search(self, initState, goal_fn, heur_fn=_zero_hfn, fval_function=_fval_function):
+    def init_search(self, initState, goal_fn, heur_fn=_zero_hfn, fval_function=_fval_function, heur_batch_fn=None):
         """
         Get ready to search. Call search on this object to run the search.
 
@@ -311,39 +1034,101 @@ class SearchEngine:
         @param goal_fn: the goal function for the puzzle
         @param heur_fn: the heuristic function to use (only relevant for search strategies that use heuristics)
         @param fval_fn: the f-value function (only relevant for custom search strategy)
+        @param heur_batch_fn: optional batched form of the heuristic. If given, it is called
+               once per expansion with the list of successors that survive cycle checking
+               and must return a sequence of their heuristic values (the same values
+               heur_fn would return); heur_fn is then only used for tracing. The
+               heuristic cache (see set_heuristic_cache) does not apply to it.
         """
         #Perform full cycle checking as follows
         #a. check state before inserting into OPEN. If we had already reached
         #   the same state via a cheaper path, don't insert into OPEN.
         #b. Sometimes we find a new cheaper path to a state (after the older
         #   more expensive path to the state has already been inserted.
-        #   We deal with this lazily. We check states extracted from OPEN
-        #   and if we have already expanded that state via a cheaper path
-        #   we don't expand it. If we had expanded the state via a more
-        #   expensive path, we re-expand it.
+        #   If the state is still on OPEN its node is replaced by the
+        #   cheaper one (see IndexedHeap). Otherwise (or if decrease_key
+        #   is turned off) we deal with this lazily. We check states
+        #   extracted from OPEN and if we have already expanded that
+        #   state via a cheaper path we don't expand it. If we had
+        #   expanded the state via a more expensive path, we re-expand it.
         
         self.initStats()
 
+        if self.heuristic_cache_size:
+            self.heuristic_cache = heur_fn = HeuristicCache(heur_fn, self.heuristic_cache_size)
+        else:
+            self.heuristic_cache = None
+
         #BEGIN TRACING
         if self.trace:
             print("   TRACE: Search Strategy: ", self.get_strategy())
             print("   TRACE: Initial State:", end="")
             initState.print_state()
         #END 
-        self.open = Open(self.strategy)
+        self.open = Open(self.strategy, fval_function, self.decrease_key and self.cycle_check == _CC_FULL,
+                         self.focal_weight, self.focal_fn)
 
-        node = sNode(initState, heur_fn(initState), fval_function)      
+        clock = time.perf_counter
+        t = clock()
+        if heur_batch_fn is not None:
+            hval = heur_batch_fn([initState])[0]
+        else:
+            hval = heur_fn(initState)
+        self.stats.heuristic_time = clock() - t
+        self.compact = (self.compact_paths and self.strategy not in (_IDA_STAR, _RBFS, _SMA_STAR) and
+                        self.cycle_check != _CC_PATH)
+        if self.compact:
+            #parent node number (-1 for the root) and action of each node
+            self.path_parent = array('l')
+            self.path_action = []
+            self.init_state = initState
+        node = self._new_node(initState, hval)
 
         #the cycle check dictionary stores the cheapest path (g-val) found
         #so far to a state. 
         if self.cycle_check == _CC_FULL:
-            self.cc_dictionary = dict() 
+            self.cc_dictionary = self.closed_list()
             self.cc_dictionary[initState.hashable_state()] = initState.gval
         
-        self.open.insert(node)
+        #IDA* restarts each iteration from the root with a larger f bound.
+        #The first bound is the f-value of the root itself.
+        if self.strategy == _IDA_STAR:
+            self.ida_root = node
+            self.ida_bound = node.gval + node.hval
+            self.ida_next_bound = float("inf")
+
+        #depth-first strategies path check against the states on the
+        #current path (see _enter_path), kept in path_keys (by depth)
+        #and path_set. Other strategies follow the parent references.
+        self.path_keys = []
+        self.path_set = set()
+        self.incremental_path = (self.cycle_check == _CC_PATH and
+                                 self.strategy in (_DEPTH_FIRST, _IDA_STAR))
+
+        #beam search collects the successors of the current layer in
+        #beam_next; beam_stack keeps the candidates each layer did not
+        #use in beam_leftovers (one list per layer) to backtrack to.
+        self.beam_next = []
+        self.beam_leftovers = []
+
+        if self.strategy == _RBFS:
+            #a frame for the root: its node, backed up f-value, f limit,
+            #children (not generated yet) and the parent's entry for it
+            self.open.open.append([node, node.gval + node.hval, float("inf"), None, None])
+            self.path_set.add(initState.hashable_state())
+            self.rbfs_stored = 1
+        elif self.strategy == _SMA_STAR:
+            self.sma_best = self.open.open
+            self.sma_worst = []
+            self.sma_count = 1
+            self._sma_queue(_SMANode(node, node.gval + node.hval, None, initState.hashable_state()))
+        else:
+            self.open.insert(node, initState.hashable_state())
+        self.stats.peak_open = 1
         self.fval_function = fval_function
         self.goal_fn = goal_fn
         self.heur_fn = heur_fn
+        self.heur_batch_fn = heur_batch_fn
 
     def search(self, timebound=10, costbound=None):
         """
@@ -356,62 +1141,437 @@ class SearchEngine:
         goal_node = []
 
         ###NOW do the search and return the result
-        self.search_start_time = os.times()[0]
-        self.search_stop_time = None
-        if timebound:
-            self.search_stop_time = self.search_start_time + timebound
-        goal_node = self._searchOpen(self.goal_fn, self.heur_fn, self.fval_function, costbound)
+        self._start_clock(timebound)
+        goal_node = self._run(costbound)
+        self._stop_clock()
+        stats = self.stats
 
         if goal_node:
             total_search_time = os.times()[0] - self.search_start_time
-            print("Solution Found with cost of {} in search time of {} sec".format(goal_node.gval, total_search_time))
-            print("Nodes expanded = {}, states generated = {}, states cycle check pruned = {}, states cost bound pruned = {}".format(
-                sNode.n, StateSpace.n, self.cycle_check_pruned, self.cost_bound_pruned))
-            return goal_node.state
+            if self.verbose:
+                print("Solution Found with cost of {} in search time of {} sec".format(goal_node.gval, total_search_time))
+                print("Nodes expanded = {}, states generated = {}, states cycle check pruned = {}, states cost bound pruned = {}".format(
+                    stats.nodes, stats.generated, stats.cycle_check_pruned, stats.cost_bound_pruned))
+            return self._goal_state(goal_node)
         else:
             #exited the while without finding goal---search failed
             total_search_time = os.times()[0] - self.search_start_time            
-            print("Search Failed! No solution found.")
-            print("Nodes expanded = {}, states generated = {}, states cycle check pruned = {}, states cost bound pruned = {}".format(
-                sNode.n, StateSpace.n, self.cycle_check_pruned, self.cost_bound_pruned))
-            return False
+            if self.verbose:
+                print("Search Failed! No solution found.")
+                print("Nodes expanded = {}, states generated = {}, states cycle check pruned = {}, states cost bound pruned = {}".format(
+                    stats.nodes, stats.generated, stats.cycle_check_pruned, stats.cost_bound_pruned))
+            #goal_node is False, or a BudgetExhausted if a budget ran out
+            return goal_node
+
+    def iter_solutions(self, timebound=10, costbound=None, prune_on='gval'):
+        """
+        Anytime search, using the parameters set by init_search. A generator
+        that yields a Solution (state, cost, elapsed) each time a goal
+        cheaper than all previous ones is found. After each goal the cost
+        bound is tightened to that goal's cost and the search continues
+        from the current OPEN, so no work is repeated. The generator stops
+        when the search space is exhausted or the timebound, measured from
+        the first call, is reached. The caller can stop at any time.
+
+        @param timebound: the maximum amount of time, in seconds, to spend on the whole search.
+        @param costbound: the initial cost bound 3-tuple for pruning, as specified in the assignment.
+        @param prune_on: 'gval' to prune states whose gval exceeds the best cost found so far,
+                         'fval' to prune states whose gval+hval exceeds it.
+        """
+        if not prune_on in ['gval', 'fval']:
+            print('Unknown prune_on value', prune_on)
+            print("Must be one of 'gval' or 'fval'")
+            return
+
+        self._start_clock(timebound)
+
+        bound = list(costbound) if costbound is not None else [float("inf"), float("inf"), float("inf")]
+        best_cost = float("inf")
+        while True:
+            goal_node = self._run(tuple(bound))
+            self._stop_clock()
+            if not goal_node:
+                return
+            if goal_node.gval < best_cost:
+                best_cost = goal_node.gval
+                elapsed = os.times()[0] - self.search_start_time
+                if self.verbose:
+                    print("Solution Found with cost of {} in search time of {} sec".format(best_cost, elapsed))
+                yield Solution(self._goal_state(goal_node), best_cost, elapsed)
+            #don't count the time the caller spent between solutions
+            self.lap_start_time = os.times()[0]
+            self.lap_start_wall = time.monotonic()
+            if prune_on == 'gval':
+                bound[0] = min(bound[0], best_cost)
+            else:
+                bound[2] = min(bound[2], best_cost)
+
+    def checkpoint(self, path, node=None):
+        '''Write the state of the search to the file path (gzip compressed
+           pickle), so that it can be continued later with resume, e.g.
+           after the process is stopped. Saved are OPEN, the cycle check
+           dictionary, the statistics (including the time searched so far),
+           the budgets and the search functions. Functions that cannot be
+           pickled (e.g., lambdas) are not saved and must be given to
+           resume. node is a node that has been taken from OPEN but not
+           yet expanded (used by the automatic checkpoints).
+
+           States are saved without their parent references, as a table
+           of states and the number of each state's parent, so that long
+           paths don't exhaust the recursion limit of pickle. The cycle
+           check dictionary is written after them in chunks of
+           _CHECKPOINT_CHUNK entries, read straight from the closed list,
+           so a closed list larger than memory (see closed_list.py) is
+           never held in memory at once. The rbfs and sma_star strategies
+           can't be checkpointed.'''
+        if self.strategy in (_RBFS, _SMA_STAR):
+            print('Checkpoints are not supported for', self.get_strategy())
+            return
+        states = []
+        parents = []
+        numbers = dict()
+        def state_number(state):
+            chain = []
+            s = state
+            while s is not None and id(s) not in numbers:
+                chain.append(s)
+                s = s.parent
+            for s in reversed(chain):
+                numbers[id(s)] = len(states)
+                parents.append(numbers[id(s.parent)] if s.parent is not None else -1)
+                saved = copy.copy(s)
+                saved.parent = None
+                states.append(saved)
+            return numbers[id(state)]
+        def flat(node):
+            if node is None:
+                return None
+            return (state_number(node.state), node.hval, node.index, node.depth)
+        def saved_function(fn):
+            try:
+                pickle.dumps(fn)
+                return fn
+            except Exception:
+                return None
+
+        heur_fn = self.heuristic_cache.heur_fn if self.heuristic_cache is not None else self.heur_fn
+        data = {'strategy': self.strategy,
+                'cycle_check': self.cycle_check,
+                'decrease_key': self.decrease_key,
+                'beam_width': self.beam_width,
+                'focal_weight': self.focal_weight,
+                'budget': (self.max_expanded, self.max_generated, self.max_open, self.max_memory, self.wallclock),
+                'functions': {'goal_fn': saved_function(self.goal_fn),
+                              'heur_fn': saved_function(heur_fn),
+                              'fval_function': saved_function(self.fval_function),
+                              'heur_batch_fn': saved_function(self.heur_batch_fn),
+                              'focal_fn': saved_function(self.focal_fn)},
+                'stats': self.stats,
+                'memory': self.memory,
+                'best_node': flat(self.best_node),
+                'open': [flat(n) for n in self.open.nodes()],
+                'pending': flat(node),
+                'cc_count': len(self.cc_dictionary) if self.cycle_check == _CC_FULL else 0,
+                'cc_hashed': (self.cycle_check == _CC_FULL and
+                              getattr(self.cc_dictionary, 'hashed_keys', False)),
+                'path_keys': self.path_keys,
+                'incremental_path': self.incremental_path,
+                'ida': ((flat(self.ida_root), self.ida_bound, self.ida_next_bound)
+                        if self.strategy == _IDA_STAR else None),
+                'beam_next': [flat(n) for n in self.beam_next],
+                'beam_leftovers': [[flat(n) for n in layer] for layer in self.beam_leftovers],
+                'compact': ((self.path_parent, self.path_action, state_number(self.init_state))
+                            if self.compact else None)}
+        #the states table last, after every state has been numbered
+        data['states'] = states
+        data['parents'] = array('l', parents)
+
+        temp_path = path + '.tmp'
+        with gzip.open(temp_path, 'wb') as f:
+            pickle.dump(data, f, pickle.HIGHEST_PROTOCOL)
+            if self.cycle_check == _CC_FULL:
+                items = iter(self.cc_dictionary.items())
+                while True:
+                    chunk = list(itertools.islice(items, _CHECKPOINT_CHUNK))
+                    pickle.dump(chunk, f, pickle.HIGHEST_PROTOCOL)
+                    if not chunk:
+                        break
+        os.replace(temp_path, path)
+
+    def resume(self, path, goal_fn=None, heur_fn=None, fval_function=None, heur_batch_fn=None, focal_fn=None):
+        '''Load a search written by checkpoint, replacing the current
+           search. Call search (or iter_solutions) afterwards to continue
+           it; no node expanded before the checkpoint is expanded again.
+           The functions that could not be saved must be given here (any
+           that are given replace the saved ones). The closed list backend
+           and heuristic cache size are those currently set on this engine,
+           except that a closed list saved from a MappedClosedList (which
+           only keeps 64-bit hashes of the keys) is loaded into a new
+           MappedClosedList, as the keys can't be restored.
+           Returns True if the search was loaded.'''
+        with gzip.open(path, 'rb') as f:
+            data = pickle.load(f)
+
+            saved = data['functions']
+            goal_fn = goal_fn or saved['goal_fn']
+            heur_fn = heur_fn or saved['heur_fn']
+            fval_function = fval_function or saved['fval_function']
+            heur_batch_fn = heur_batch_fn or saved['heur_batch_fn']
+            focal_fn = focal_fn or saved['focal_fn']
+            if goal_fn is None or heur_fn is None or fval_function is None:
+                print('Checkpoint', path, 'is missing search functions; give them to resume')
+                return False
+
+            #the cycle check dictionary follows in chunks, ended by an empty one
+            cc_dictionary = None
+            if data['cycle_check'] == _CC_FULL:
+                if data.get('cc_hashed'):
+                    from closed_list import MappedClosedList
+                    cc_dictionary = MappedClosedList(capacity=2 * data['cc_count'])
+                else:
+                    cc_dictionary = self.closed_list()
+                chunk = pickle.load(f)
+                while chunk:
+                    for key, gval in chunk:
+                        cc_dictionary[key] = gval
+                    chunk = pickle.load(f)
+
+        states = data['states']
+        for state, parent in zip(states, data['parents']):
+            state.parent = states[parent] if parent >= 0 else None
+        def node(flat):
+            if flat is None:
+                return None
+            return sNode(states[flat[0]], flat[1], None, flat[2], flat[3])
+
+        self.strategy = data['strategy']
+        self.cycle_check = data['cycle_check']
+        self.decrease_key = data['decrease_key']
+        self.beam_width = data['beam_width']
+        self.focal_weight = data['focal_weight']
+        self.focal_fn = focal_fn
+        self.set_budget(*data['budget'])
+        self.stats = data['stats']
+        self.memory = data['memory']
+        self.best_node = node(data['best_node'])
+
+        if self.heuristic_cache_size:
+            self.heuristic_cache = heur_fn = HeuristicCache(heur_fn, self.heuristic_cache_size)
+        else:
+            self.heuristic_cache = None
+        self.goal_fn = goal_fn
+        self.heur_fn = heur_fn
+        self.fval_function = fval_function
+        self.heur_batch_fn = heur_batch_fn
+
+        compact = data['compact']
+        self.compact = compact is not None
+        if self.compact:
+            self.path_parent, self.path_action, init_number = compact
+            self.init_state = states[init_number]
+
+        if cc_dictionary is not None:
+            self.cc_dictionary = cc_dictionary
+
+        self.open = Open(self.strategy, fval_function, self.decrease_key and self.cycle_check == _CC_FULL,
+                         self.focal_weight, focal_fn)
+        for n in map(node, data['open']):
+            self.open.insert(n, n.state.hashable_state())
+        pending = node(data['pending'])
+        if pending is not None:
+            self.open.put_back(pending)
+
+        self.path_keys = data['path_keys']
+        self.path_set = set(self.path_keys)
+        self.incremental_path = data['incremental_path']
+        if data['ida'] is not None:
+            root, self.ida_bound, self.ida_next_bound = data['ida']
+            self.ida_root = node(root)
+        self.beam_next = [node(n) for n in data['beam_next']]
+        self.beam_leftovers = [[node(n) for n in layer] for layer in data['beam_leftovers']]
+        return True
+
+    def _start_clock(self, timebound):
+        '''Record the start of a search and compute its deadlines'''
+        self.search_start_time = os.times()[0]
+        self.search_stop_time = None
+        if timebound:
+            self.search_stop_time = self.search_start_time + timebound
+        self.wallclock_stop_time = None
+        if self.wallclock is not None:
+            self.wallclock_stop_time = time.monotonic() + self.wallclock
+        self.lap_start_time = self.search_start_time
+        self.lap_start_wall = time.monotonic()
+        if self.checkpoint_path is not None:
+            self.next_checkpoint = self.lap_start_wall + self.checkpoint_every
+
+    def _stop_clock(self):
+        '''Add the time searched since the clock was (re)started to the stats'''
+        now = os.times()[0]
+        now_wall = time.monotonic()
+        self.stats.elapsed += now - self.lap_start_time
+        self.stats.wall_time += now_wall - self.lap_start_wall
+        self.lap_start_time = now
+        self.lap_start_wall = now_wall
+        if self.cycle_check == _CC_FULL and self.strategy != _IDA_STAR:
+            self.stats.cc_size = len(self.cc_dictionary)
+        if self.heuristic_cache is not None:
+            self.stats.heuristic_cache_hits = self.heuristic_cache.hits
+            self.stats.heuristic_cache_misses = self.heuristic_cache.misses
+
+    def _budget_exhausted(self, node=None):
+        '''Return the name of the first budget that has run out, or None.
+           Called once per expansion, with the node about to be expanded.
+           Also writes the automatic checkpoints.'''
+        if self.search_stop_time and os.times()[0] > self.search_stop_time:
+            return 'time'
+        if not self.budgeted:
+            return None
+        if (self.checkpoint_path is not None and self.stats.expanded % 64 == 0 and
+            time.monotonic() >= self.next_checkpoint):
+            self._stop_clock()
+            self.checkpoint(self.checkpoint_path, node)
+            self.next_checkpoint = time.monotonic() + self.checkpoint_every
+        if self.stop_event is not None and self.stats.expanded % 64 == 0 and self.stop_event.is_set():
+            return 'cancelled'
+        if self.wallclock_stop_time is not None and time.monotonic() > self.wallclock_stop_time:
+            return 'wallclock'
+        stats = self.stats
+        if self.max_expanded is not None and stats.expanded >= self.max_expanded:
+            return 'expanded'
+        if self.max_generated is not None and stats.generated >= self.max_generated:
+            return 'generated'
+        if self.max_open is not None and stats.peak_open > self.max_open:
+            return 'open'
+        if self.max_memory is not None and stats.expanded % 1024 == 0:
+            self.memory = _memory_usage()
+            if self.memory > self.max_memory:
+                return 'memory'
+        return None
+
+    def _exhausted(self, reason, node=None):
+        '''Build the result returned when a budget runs out. node, the
+           node that was about to be expanded, is put back on OPEN so
+           the search can be continued.'''
+        if node is not None:
+            self.open.put_back(node)
+        if self.verbose:
+            if reason == 'time':
+                print("TRACE: Search has exceeeded the time bound provided.")
+            else:
+                print("TRACE: Search has exceeded its {} budget.".format(reason))
+        best = self.best_node
+        stats = self.stats
+        return BudgetExhausted(reason, best.state if best else None, best.hval if best else None,
+                               stats.expanded, stats.generated, len(self.open.open), stats.peak_open,
+                               self.memory, os.times()[0] - self.search_start_time, stats)
+
+    def _run(self, costbound):
+        '''Continue the search with the current strategy until a goal is found
+           (return its node) or the search fails (return False)'''
+        sink = None
+        if self.sinks or self.trace:
+            sinks = list(self.sinks)
+            if self.trace:
+                sinks.append(TraceSink(self.trace))
+            sink = sinks[0] if len(sinks) == 1 else SinkGroup(sinks)
+        if self.strategy == _IDA_STAR:
+            return self._searchIDA(self.goal_fn, self.heur_fn, costbound, sink)
+        if self.strategy == _RBFS:
+            return self._searchRBFS(self.goal_fn, self.heur_fn, costbound, sink)
+        if self.strategy == _SMA_STAR:
+            return self._searchSMA(self.goal_fn, self.heur_fn, costbound, sink)
+        if self.strategy == _BEAM or self.strategy == _BEAM_STACK:
+            return self._searchBeam(self.goal_fn, self.heur_fn, self.fval_function, costbound, sink)
+        if sink is not None:
+            return self._searchOpenObserved(self.goal_fn, self.heur_fn, self.fval_function, costbound, sink)
+        return self._searchOpen(self.goal_fn, self.heur_fn, self.fval_function, costbound)
+
+    def _heuristic_values(self, heur_fn, states):
+        '''Return the heuristic values of states, with one call of
+           heur_batch_fn if there is one'''
+        clock = time.perf_counter
+        t = clock()
+        if self.heur_batch_fn is not None:
+            hvals = self.heur_batch_fn(states) if states else []
+        else:
+            hvals = [heur_fn(state) for state in states]
+        self.stats.heuristic_time += clock() - t
+        return hvals
+
+    def _new_node(self, state, hval, parent_index=-1, depth=0):
+        '''Create the next search node, numbering it with this engine's
+           counter. With compact paths, record the node's parent and
+           action and drop the state's parent reference.'''
+        node = sNode(state, hval, None, self.stats.nodes, depth)
+        self.stats.nodes = self.stats.nodes + 1
+        if self.compact:
+            self.path_parent.append(parent_index)
+            self.path_action.append(state.action)
+            state.parent = None
+        return node
+
+    def _enter_path(self, node):
+        '''Make node the last node of the current depth-first path: drop
+           the path's nodes at node's depth or deeper, then add node. The
+           keys of the path's states are kept in self.path_set, so
+           successors can be path checked with one set lookup.'''
+        keys = self.path_keys
+        path_set = self.path_set
+        while len(keys) > node.depth:
+            path_set.discard(keys.pop())
+        key = node.state.hashable_state()
+        keys.append(key)
+        path_set.add(key)
+
+    def _goal_state(self, goal_node):
+        '''Return the state of goal_node, with its path. With compact paths
+           the path is rebuilt by replaying the recorded actions.'''
+        if not self.compact:
+            return goal_node.state
+        actions = []
+        i = goal_node.index
+        while self.path_parent[i] != -1:
+            actions.append(self.path_action[i])
+            i = self.path_parent[i]
+        state = self.init_state
+        for action in reversed(actions):
+            for succ in state.successors():
+                if succ.action == action:
+                    state = succ
+                    break
+        return state
 
     def _searchOpen(self, goal_fn, heur_fn, fval_function, costbound):
         """
-        Search, starting from self.open.
+        Search, starting from self.open. This loop has no tracing or
+        events; _searchOpenObserved is the same search with them.
 
         @param goal_fn: the goal function.
         @param heur_fn: the heuristic function.
         @param fval_function: the f-value function (only relevant when using a custom search strategy).
         @param costbound: the cost bound 3-tuple, as described in the assignment.
         """
-
-        #BEGIN TRACING
-        if self.trace:
-            print("   TRACE: Initial OPEN: ", self.open.print_open())
-            if self.cycle_check == _CC_FULL:
-                print("   TRACE: Initial CC_Dict:", self.cc_dictionary)
-        #END TRACING
+        stats = self.stats
+        clock = time.perf_counter
+        incremental_path = self.incremental_path
         while not self.open.empty():
+            t = clock()
             node = self.open.extract()
+            stats.open_time += clock() - t
 
-            #BEGIN TRACING
-            if self.trace:
-                print("   TRACE: Next State to expand: <S{}:{}:{}, g={}, h={}, f=g+h={}>".format(
-                    node.state.index, node.state.action, node.state.hashable_state(), node.gval, node.hval, node.gval + node.hval))
-                if node.state.gval != node.gval:
-                    print("ERROR: Node gval not equal to state gval!")
-            #END TRACING
-                        
             if goal_fn(node.state):
               #node at front of OPEN is a goal...search is completed.
               return node
 
-            if self.search_stop_time: #timebound check
-              if os.times()[0] > self.search_stop_time:                
-                #exceeded time bound, must terminate search
-                print("TRACE: Search has exceeeded the time bound provided.")
-                return False
+            if self.search_stop_time or self.budgeted: #timebound and budget check
+              reason = self._budget_exhausted(node)
+              if reason:
+                #exceeded time bound or budget, must terminate search
+                return self._exhausted(reason, node)
+
+            if self.best_node is None or node.hval < self.best_node.hval:
+              self.best_node = node
 
              #All states reached by a search node on OPEN have already
              #been hashed into the self.cc_dictionary. However,
@@ -419,88 +1579,693 @@ class SearchEngine:
              #an equivalent state with lower g-value. So only expand
              #the node if the hashed g-value is no greater than the
              #node's current g-value. 
-
-            #BEGIN TRACING
-            if self.trace:
-                if self.cycle_check == _CC_FULL: print("   TRACE: CC_dict gval={}, node.gval={}".format(
-                    self.cc_dictionary[node.state.hashable_state()], node.gval))
-            #END TRACING
-
             if self.cycle_check == _CC_FULL and self.cc_dictionary[node.state.hashable_state()] < node.gval:
+                stats.stale_pruned = stats.stale_pruned + 1
                 continue
 
-            successors = node.state.successors()
+            if incremental_path:
+                self._enter_path(node)
 
-            #BEGIN TRACING
-            if self.trace:
-                print("   TRACE: Expanding Node. Successors = {", end="")
-                for ss in successors:                  
-                    print("<S{}:{}:{}, g={}, h={}, f=g+h={}>, ".format(
-                        ss.index, ss.action, ss.hashable_state(), ss.gval, heur_fn(ss), ss.gval+heur_fn(ss)), end="")                    
-                print("}")
-            #END TRACING
+            t = clock()
+            successors = node.state.successors()
+            stats.successor_time += clock() - t
+            stats.expanded = stats.expanded + 1
+            stats.generated = stats.generated + len(successors)
 
+            #cycle check the successors, then compute the heuristic
+            #values of those that are left
+            survivors = []
             for succ in successors:
                 hash_state = succ.hashable_state()
-                if self.trace > 1: 
-                  if self.cycle_check == _CC_FULL and hash_state in self.cc_dictionary:
-                      print("   TRACE: Already in CC_dict, CC_dict gval={}, successor state gval={}".format(
-                        self.cc_dictionary[hash_state], succ.gval))   
+                prune_succ = (self.cycle_check == _CC_FULL and
+                              hash_state in self.cc_dictionary and
+                              succ.gval > self.cc_dictionary[hash_state]
+                             ) or (
+                              self.cycle_check == _CC_PATH and
+                              (hash_state in self.path_set if incremental_path else succ.has_path_cycle())
+                             )
+
+                if prune_succ :
+                    stats.cycle_check_pruned = stats.cycle_check_pruned + 1
+                    continue
+                survivors.append((succ, hash_state))
+
+            hvals = self._heuristic_values(heur_fn, [succ for succ, hash_state in survivors])
+            for (succ, hash_state), succ_hval in zip(survivors, hvals):
+                #an earlier successor may have reached the same state more cheaply
+                if (self.cycle_check == _CC_FULL and hash_state in self.cc_dictionary and
+                    succ.gval > self.cc_dictionary[hash_state]):
+                    stats.cycle_check_pruned = stats.cycle_check_pruned + 1
+                    continue
+
+                if costbound is not None and (succ.gval > costbound[0] or
+                                              succ_hval > costbound[1] or
+                                              succ.gval + succ_hval > costbound[2]) : 
+                    stats.cost_bound_pruned = stats.cost_bound_pruned + 1
+                    continue                    
 
-                #BEGIN TRACING
-                if self.trace > 1:
-                    print("   TRACE: Successor State:", end="")
-                    succ.print_state()
-                    print("   TRACE: Heuristic Value:", heur_fn(succ))
+                #passed all cycle checks and costbound checks ...add to open
+                succ_node = self._new_node(succ, succ_hval, node.index, node.depth + 1)
+                t = clock()
+                self.open.insert(succ_node, hash_state)
+                stats.open_time += clock() - t
 
-                    if self.cycle_check == _CC_FULL and hash_state in self.cc_dictionary:
-                        print("   TRACE: Already in CC_dict, CC_dict gval={}, successor state gval={}".format(
-                            self.cc_dictionary[hash_state], succ.gval))
+                #record cost of this path in dictionary.
+                if self.cycle_check == _CC_FULL:
+                    self.cc_dictionary[hash_state] = succ.gval
 
-                    if self.cycle_check == _CC_PATH and succ.has_path_cycle():
-                        print("   TRACE: On cyclic path")
-                #END TRACING
+            if len(self.open.open) > stats.peak_open:
+                stats.peak_open = len(self.open.open)
+
+        #end of while--OPEN is empty and no solution
+        return False
 
+    def _searchOpenObserved(self, goal_fn, heur_fn, fval_function, costbound, sink):
+        """
+        Search, starting from self.open, sending the events of the search
+        to sink (see SearchSink). Otherwise the same as _searchOpen.
+        """
+
+        #BEGIN TRACING
+        if self.trace:
+            print("   TRACE: Initial OPEN: ", self.open.print_open())
+            if self.cycle_check == _CC_FULL:
+                print("   TRACE: Initial CC_Dict:", self.cc_dictionary)
+        #END TRACING
+        stats = self.stats
+        clock = time.perf_counter
+        incremental_path = self.incremental_path
+        while not self.open.empty():
+            t = clock()
+            node = self.open.extract()
+            stats.open_time += clock() - t
+
+            if goal_fn(node.state):
+              sink.on_goal(node)
+              return node
+
+            if self.search_stop_time or self.budgeted: #timebound and budget check
+              reason = self._budget_exhausted(node)
+              if reason:
+                return self._exhausted(reason, node)
+
+            if self.best_node is None or node.hval < self.best_node.hval:
+              self.best_node = node
+
+            if self.cycle_check == _CC_FULL and self.cc_dictionary[node.state.hashable_state()] < node.gval:
+                stats.stale_pruned = stats.stale_pruned + 1
+                sink.on_prune(node.state, 'stale')
+                continue
+
+            if incremental_path:
+                self._enter_path(node)
+
+            t = clock()
+            successors = node.state.successors()
+            stats.successor_time += clock() - t
+            stats.expanded = stats.expanded + 1
+            stats.generated = stats.generated + len(successors)
+            sink.on_expand(node, successors)
+
+            survivors = []
+            for succ in successors:
+                hash_state = succ.hashable_state()
                 prune_succ = (self.cycle_check == _CC_FULL and
                               hash_state in self.cc_dictionary and
                               succ.gval > self.cc_dictionary[hash_state]
                              ) or (
                               self.cycle_check == _CC_PATH and
-                              succ.has_path_cycle()
+                              (hash_state in self.path_set if incremental_path else succ.has_path_cycle())
                              )
 
                 if prune_succ :
-                    self.cycle_check_pruned = self.cycle_check_pruned + 1
-                    #BEGIN TRACING
-                    if self.trace > 1:
-                        print(" TRACE: Successor State pruned by cycle checking")
-                        print("\n")                        
-                    #END TRACING
+                    stats.cycle_check_pruned = stats.cycle_check_pruned + 1
+                    sink.on_prune(succ, 'cycle_check')
+                    continue
+                survivors.append((succ, hash_state))
+
+            hvals = self._heuristic_values(heur_fn, [succ for succ, hash_state in survivors])
+            for (succ, hash_state), succ_hval in zip(survivors, hvals):
+                if (self.cycle_check == _CC_FULL and hash_state in self.cc_dictionary and
+                    succ.gval > self.cc_dictionary[hash_state]):
+                    stats.cycle_check_pruned = stats.cycle_check_pruned + 1
+                    sink.on_prune(succ, 'cycle_check')
                     continue
 
-                succ_hval = heur_fn(succ)
                 if costbound is not None and (succ.gval > costbound[0] or
                                               succ_hval > costbound[1] or
                                               succ.gval + succ_hval > costbound[2]) : 
-                    self.cost_bound_pruned = self.cost_bound_pruned + 1
-                    if self.trace > 1:
-                      print(" TRACE: Successor State pruned, over current cost bound of {}", costbound)
-                      print("\n") 
+                    stats.cost_bound_pruned = stats.cost_bound_pruned + 1
+                    sink.on_prune(succ, 'cost_bound')
                     continue                    
 
-                #passed all cycle checks and costbound checks ...add to open
-                self.open.insert(sNode(succ, succ_hval, node.fval_function))
-
-                #BEGIN TRACING
-                if self.trace > 1:
-                    print(" TRACE: Successor State added to OPEN")
-                    print("\n")
-                #END TRACING
+                succ_node = self._new_node(succ, succ_hval, node.index, node.depth + 1)
+                t = clock()
+                self.open.insert(succ_node, hash_state)
+                stats.open_time += clock() - t
+                sink.on_generate(succ_node)
 
-                #record cost of this path in dictionary.
                 if self.cycle_check == _CC_FULL:
                     self.cc_dictionary[hash_state] = succ.gval
 
-        #end of while--OPEN is empty and no solution
+            if len(self.open.open) > stats.peak_open:
+                stats.peak_open = len(self.open.open)
+
+        return False
+
+    def _searchIDA(self, goal_fn, heur_fn, costbound, sink=None):
+        """
+        Iterative deepening A*, starting from self.open.
+
+        Each iteration is a depth-first search that does not generate
+        nodes whose f-value (gval+hval) exceeds the current bound. When
+        an iteration exhausts OPEN the bound is raised to the smallest
+        f-value that was cut off and the search restarts from the
+        root. Only the current path and its unexpanded siblings are
+        stored, so memory is proportional to the solution depth. The
+        stack and bounds are kept on self so that search can be called
+        again after a goal is found (e.g., with a tighter costbound).
+
+        @param goal_fn: the goal function.
+        @param heur_fn: the heuristic function.
+        @param costbound: the cost bound 3-tuple, as described in the assignment.
+        @param sink: the SearchSink to send events to (None for none).
+        """
+        stats = self.stats
+        clock = time.perf_counter
+        incremental_path = self.incremental_path
+        while True:
+            while not self.open.empty():
+                node = self.open.extract()
+
+                if goal_fn(node.state):
+                    if sink is not None:
+                        sink.on_goal(node)
+                    return node
+
+                if self.search_stop_time or self.budgeted: #timebound and budget check
+                    reason = self._budget_exhausted(node)
+                    if reason:
+                        return self._exhausted(reason, node)
+
+                if self.best_node is None or node.hval < self.best_node.hval:
+                    self.best_node = node
+
+                if incremental_path:
+                    self._enter_path(node)
+
+                t = clock()
+                successors = node.state.successors()
+                stats.successor_time += clock() - t
+                stats.expanded = stats.expanded + 1
+                stats.generated = stats.generated + len(successors)
+                if sink is not None:
+                    sink.on_expand(node, successors)
+
+                survivors = []
+                for succ in successors:
+                    if self.cycle_check == _CC_PATH and (succ.hashable_state() in self.path_set if incremental_path
+                                                         else succ.has_path_cycle()):
+                        stats.cycle_check_pruned = stats.cycle_check_pruned + 1
+                        if sink is not None:
+                            sink.on_prune(succ, 'cycle_check')
+                        continue
+                    survivors.append(succ)
+
+                hvals = self._heuristic_values(heur_fn, survivors)
+                for succ, succ_hval in zip(survivors, hvals):
+                    if costbound is not None and (succ.gval > costbound[0] or
+                                                  succ_hval > costbound[1] or
+                                                  succ.gval + succ_hval > costbound[2]) :
+                        stats.cost_bound_pruned = stats.cost_bound_pruned + 1
+                        if sink is not None:
+                            sink.on_prune(succ, 'cost_bound')
+                        continue
+
+                    #beyond this iteration's bound: remember the smallest
+                    #such f-value as the bound for the next iteration.
+                    succ_fval = succ.gval + succ_hval
+                    if succ_fval > self.ida_bound:
+                        stats.f_bound_pruned = stats.f_bound_pruned + 1
+                        if succ_fval < self.ida_next_bound:
+                            self.ida_next_bound = succ_fval
+                        if sink is not None:
+                            sink.on_prune(succ, 'f_bound')
+                        continue
+
+                    succ_node = self._new_node(succ, succ_hval, depth=node.depth + 1)
+                    self.open.insert(succ_node)
+                    if sink is not None:
+                        sink.on_generate(succ_node)
+
+                if len(self.open.open) > stats.peak_open:
+                    stats.peak_open = len(self.open.open)
+
+            if self.ida_next_bound == float("inf"):
+                #nothing was cut off by the bound, so the space is exhausted
+                return False
+
+            self.ida_bound = self.ida_next_bound
+            self.ida_next_bound = float("inf")
+            #BEGIN TRACING
+            if self.trace:
+                print("   TRACE: IDA* starting new iteration with f bound {}".format(self.ida_bound))
+            #END TRACING
+            root = self.ida_root
+            self.open.insert(self._new_node(root.state, root.hval))
+
+    def _searchBeam(self, goal_fn, heur_fn, fval_function, costbound, sink=None):
+        """
+        Beam search, starting from self.open.
+
+        The search proceeds one depth layer at a time. The nodes of the
+        current layer are kept on self.open and their successors are
+        collected in self.beam_next. When the layer has been expanded
+        the successors are ranked by fval_function (by hval with the
+        default fval_function) and the best beam_width of them become
+        the next layer, so memory is proportional to beam_width times
+        the depth. The beam strategy discards the other successors, so
+        it can fail on a problem that has a solution. With full cycle
+        checking only the states chosen for a layer are recorded in the
+        cycle check dictionary, so its size is bounded in the same way. beam_stack keeps
+        them in self.beam_leftovers and, when a layer has no successors
+        left, backtracks to the deepest layer that still has unused
+        candidates and continues with the next beam_width of them.
+
+        @param goal_fn: the goal function.
+        @param heur_fn: the heuristic function.
+        @param fval_function: the function used to rank the nodes of a layer.
+        @param costbound: the cost bound 3-tuple, as described in the assignment.
+        @param sink: the SearchSink to send events to (None for none).
+        """
+        stats = self.stats
+        clock = time.perf_counter
+        layer = self.open.open
+        rank = lambda node: (fval_function(node), node.index)
+        while True:
+            while layer:
+                node = layer.pop()
+
+                if goal_fn(node.state):
+                    if sink is not None:
+                        sink.on_goal(node)
+                    return node
+
+                if self.search_stop_time or self.budgeted: #timebound and budget check
+                    reason = self._budget_exhausted(node)
+                    if reason:
+                        return self._exhausted(reason, node)
+
+                if self.best_node is None or node.hval < self.best_node.hval:
+                    self.best_node = node
+
+                if self.cycle_check == _CC_FULL and self.cc_dictionary[node.state.hashable_state()] < node.gval:
+                    stats.stale_pruned = stats.stale_pruned + 1
+                    if sink is not None:
+                        sink.on_prune(node.state, 'stale')
+                    continue
+
+                t = clock()
+                successors = node.state.successors()
+                stats.successor_time += clock() - t
+                stats.expanded = stats.expanded + 1
+                stats.generated = stats.generated + len(successors)
+                if sink is not None:
+                    sink.on_expand(node, successors)
+
+                survivors = []
+                for succ in successors:
+                    if self.cycle_check == _CC_FULL:
+                        hash_state = succ.hashable_state()
+                        prune_succ = hash_state in self.cc_dictionary and succ.gval >= self.cc_dictionary[hash_state]
+                    else:
+                        prune_succ = self.cycle_check == _CC_PATH and succ.has_path_cycle()
+                    if prune_succ:
+                        stats.cycle_check_pruned = stats.cycle_check_pruned + 1
+                        if sink is not None:
+                            sink.on_prune(succ, 'cycle_check')
+                        continue
+                    survivors.append(succ)
+
+                hvals = self._heuristic_values(heur_fn, survivors)
+                for succ, succ_hval in zip(survivors, hvals):
+                    if costbound is not None and (succ.gval > costbound[0] or
+                                                  succ_hval > costbound[1] or
+                                                  succ.gval + succ_hval > costbound[2]) :
+                        stats.cost_bound_pruned = stats.cost_bound_pruned + 1
+                        if sink is not None:
+                            sink.on_prune(succ, 'cost_bound')
+                        continue
+
+                    succ_node = self._new_node(succ, succ_hval, node.index, node.depth + 1)
+                    self.beam_next.append(succ_node)
+                    if sink is not None:
+                        sink.on_generate(succ_node)
+
+                size = len(layer) + len(self.beam_next)
+                if size > stats.peak_open:
+                    stats.peak_open = size
+
+            #the layer is used up: choose the next one from its successors
+            candidates = self.beam_next
+            self.beam_next = []
+            candidates.sort(key=rank)
+            if self.strategy == _BEAM:
+                if not candidates:
+                    return False
+            else:
+                leftovers = self.beam_leftovers
+                leftovers.append(candidates)
+                if not candidates:
+                    while leftovers and not leftovers[-1]:
+                        leftovers.pop()
+                    if not leftovers:
+                        return False
+                    #BEGIN TRACING
+                    if self.trace:
+                        print("   TRACE: beam_stack backtracking to layer {}".format(len(leftovers)))
+                    #END TRACING
+                candidates = leftovers[-1]
+            self._beam_select(candidates, layer, sink)
+
+    def _beam_select(self, candidates, layer, sink=None):
+        '''Move the best beam_width nodes from the front of candidates
+           (sorted best first) onto layer, best last. With full cycle
+           checking a node is skipped if its state is already in a layer
+           with an equal or lower gval; the chosen states are recorded
+           in the cycle check dictionary.'''
+        chosen = []
+        i = 0
+        while i < len(candidates) and len(chosen) < self.beam_width:
+            node = candidates[i]
+            i = i + 1
+            if self.cycle_check == _CC_FULL:
+                hash_state = node.state.hashable_state()
+                if hash_state in self.cc_dictionary and node.gval >= self.cc_dictionary[hash_state]:
+                    self.stats.cycle_check_pruned = self.stats.cycle_check_pruned + 1
+                    if sink is not None:
+                        sink.on_prune(node.state, 'cycle_check')
+                    continue
+                self.cc_dictionary[hash_state] = node.gval
+            chosen.append(node)
+        del candidates[:i]
+        chosen.reverse()
+        layer.extend(chosen)
+
+    def _searchRBFS(self, goal_fn, heur_fn, costbound, sink=None):
+        """
+        Recursive best-first search (RBFS), starting from the frames on
+        self.open.
+
+        RBFS expands the child with the lowest f-value (its backed up
+        value if it has been searched before) and explores below it
+        only while its f-value stays within the f-value of the best
+        alternative along the path. When it goes over, the lowest
+        f-value found below it is backed up to it and the search
+        continues from the alternative. Only the current path and the
+        children of its nodes are stored, so memory is linear in the
+        depth, and fewer nodes are expanded again than by IDA*. The
+        recursion is kept as a stack of frames [node, backed up f, f
+        limit, children, parent's entry for node]; a child entry is
+        [f, node number, node].
+
+        @param goal_fn: the goal function.
+        @param heur_fn: the heuristic function.
+        @param costbound: the cost bound 3-tuple, as described in the assignment.
+        @param sink: the SearchSink to send events to (None for none).
+        """
+        stats = self.stats
+        clock = time.perf_counter
+        stack = self.open.open
+        path_set = self.path_set
+        path_check = self.cycle_check == _CC_PATH
+        infinity = float("inf")
+        while stack:
+            frame = stack[-1]
+            node, node_f, limit, children, entry = frame
+            if children is None:
+                if goal_fn(node.state):
+                    #if searched again, back up from the goal
+                    frame[3] = []
+                    if sink is not None:
+                        sink.on_goal(node)
+                    return node
+
+                if self.search_stop_time or self.budgeted: #timebound and budget check
+                    reason = self._budget_exhausted()
+                    if reason:
+                        return self._exhausted(reason)
+
+                if self.best_node is None or node.hval < self.best_node.hval:
+                    self.best_node = node
+
+                t = clock()
+                successors = node.state.successors()
+                stats.successor_time += clock() - t
+                stats.expanded = stats.expanded + 1
+                stats.generated = stats.generated + len(successors)
+                if sink is not None:
+                    sink.on_expand(node, successors)
+
+                survivors = []
+                for succ in successors:
+                    if path_check and succ.hashable_state() in path_set:
+                        stats.cycle_check_pruned = stats.cycle_check_pruned + 1
+                        if sink is not None:
+                            sink.on_prune(succ, 'cycle_check')
+                        continue
+                    survivors.append(succ)
+
+                hvals = self._heuristic_values(heur_fn, survivors)
+                children = []
+                for succ, succ_hval in zip(survivors, hvals):
+                    if costbound is not None and (succ.gval > costbound[0] or
+                                                  succ_hval > costbound[1] or
+                                                  succ.gval + succ_hval > costbound[2]) :
+                        stats.cost_bound_pruned = stats.cost_bound_pruned + 1
+                        if sink is not None:
+                            sink.on_prune(succ, 'cost_bound')
+                        continue
+                    child = self._new_node(succ, succ_hval, node.index, node.depth + 1)
+                    if sink is not None:
+                        sink.on_generate(child)
+                    child_f = succ.gval + succ_hval
+                    #below a node searched before, children inherit its backed up value
+                    if node.gval + node.hval < node_f and child_f < node_f:
+                        child_f = node_f
+                    children.append([child_f, child.index, child])
+                if self.node_limit is not None and self.rbfs_stored + len(children) > self.node_limit:
+                    #expanded again if the search is continued with a higher limit
+                    return self._exhausted('node_limit')
+                frame[3] = children
+                self.rbfs_stored = self.rbfs_stored + len(children)
+                if self.rbfs_stored > stats.peak_open:
+                    stats.peak_open = self.rbfs_stored
+
+            children.sort()
+            if not children or children[0][0] > limit or children[0][0] == infinity:
+                #back up the best f-value below node and return to its parent
+                if children and children[0][0] > limit:
+                    stats.f_bound_pruned = stats.f_bound_pruned + 1
+                    if sink is not None:
+                        sink.on_prune(node.state, 'f_bound')
+                stack.pop()
+                self.rbfs_stored = self.rbfs_stored - len(children)
+                path_set.discard(node.state.hashable_state())
+                if entry is not None:
+                    entry[0] = children[0][0] if children else infinity
+                continue
+
+            best = children[0]
+            alternative = children[1][0] if len(children) > 1 else infinity
+            stack.append([best[2], best[0], min(limit, alternative), None, best])
+            path_set.add(best[2].state.hashable_state())
+
         return False
-            
+
+    def _sma_queue(self, rec):
+        '''Put rec on the SMA* queue (again, with its current f-value)'''
+        rec.version = rec.version + 1
+        rec.queued = True
+        node = rec.node
+        heapq.heappush(self.sma_best, (rec.f, -node.depth, node.index, rec.version, rec))
+        heapq.heappush(self.sma_worst, (-rec.f, node.depth, node.index, rec.version, rec))
+        #drop the out of date entries when they make up most of the heaps
+        if len(self.sma_best) > 4 * self.sma_count + 64:
+            best = [entry for entry in self.sma_best if entry[-1].queued and entry[3] == entry[-1].version]
+            heapq.heapify(best)
+            self.sma_best[:] = best
+            self.sma_worst = [(-entry[0], -entry[1], entry[2], entry[3], entry[4]) for entry in best]
+            heapq.heapify(self.sma_worst)
+
+    def _sma_dequeue(self, rec):
+        '''Take rec off the SMA* queue'''
+        rec.version = rec.version + 1
+        rec.queued = False
+
+    def _sma_backup(self, rec):
+        '''Set the f-value of rec, and then of its ancestors, to the lowest
+           f-value of its children (in memory or forgotten)'''
+        while rec is not None and rec.expanded:
+            f = rec.forgotten
+            for child in rec.children.values():
+                if child.f < f:
+                    f = child.f
+            if f == rec.f:
+                return
+            rec.f = f
+            if rec.queued:
+                self._sma_queue(rec)
+            rec = rec.parent
+
+    def _sma_evict(self, sink=None, keep=None):
+        '''Forget the shallowest of the leaves with the highest f-value
+           (other than keep, the node being expanded). Its f-value is
+           backed up to its parent, which is put back on the queue to
+           generate it again later. Returns False if no leaf can be
+           forgotten.'''
+        worst = self.sma_worst
+        kept = None
+        while worst:
+            entry = heapq.heappop(worst)
+            rec = entry[-1]
+            if entry[3] != rec.version or not rec.queued or rec.children or rec.parent is None:
+                continue
+            if rec is keep:
+                kept = entry
+                continue
+            if kept is not None:
+                heapq.heappush(worst, kept)
+            self._sma_dequeue(rec)
+            parent = rec.parent
+            del parent.children[rec.key]
+            self.sma_count = self.sma_count - 1
+            if rec.f < parent.forgotten:
+                parent.forgotten = rec.f
+            self._sma_queue(parent)
+            self._sma_backup(parent)
+            self.stats.forgotten_pruned = self.stats.forgotten_pruned + 1
+            if sink is not None:
+                sink.on_prune(rec.node.state, 'forgotten')
+            return True
+        if kept is not None:
+            heapq.heappush(worst, kept)
+        return False
+
+    def _searchSMA(self, goal_fn, heur_fn, costbound, sink=None):
+        """
+        Simplified memory-bounded A* (SMA*), starting from the queue in
+        self.sma_best.
+
+        Like A*, SMA* expands the queued node with the lowest f-value
+        (the deepest one on ties), but it stores at most node_limit
+        nodes. When it needs room for a new node it first forgets the
+        shallowest of the leaves with the highest f-value (which may be
+        a sibling generated just before) and backs up that f-value to
+        the leaf's parent, which then goes back on the queue so the leaf
+        can be generated again if the rest of the tree turns out to be
+        worse. f-values are kept monotone along paths (pathmax), and
+        a node's f-value is backed up to the lowest f-value of its
+        children. A non-goal node at depth node_limit - 1 can't be
+        extended to a path within the limit, so gets an infinite
+        f-value. A goal is returned when it is taken from the queue,
+        so with an admissible heuristic it is the cheapest goal that
+        can be reached within the node limit.
+
+        @param goal_fn: the goal function.
+        @param heur_fn: the heuristic function.
+        @param costbound: the cost bound 3-tuple, as described in the assignment.
+        @param sink: the SearchSink to send events to (None for none).
+        """
+        stats = self.stats
+        clock = time.perf_counter
+        limit = self.node_limit if self.node_limit is not None else 100000
+        infinity = float("inf")
+        best = self.sma_best
+        while True:
+            rec = None
+            while best:
+                entry = heapq.heappop(best)
+                if entry[-1].queued and entry[3] == entry[-1].version:
+                    rec = entry[-1]
+                    break
+            if rec is None or rec.f == infinity:
+                return False
+            self._sma_dequeue(rec)
+            node = rec.node
+
+            if goal_fn(node.state):
+                #if searched again, this goal is a dead end
+                rec.f = infinity
+                self._sma_queue(rec)
+                self._sma_backup(rec.parent)
+                if sink is not None:
+                    sink.on_goal(node)
+                return node
+
+            if self.search_stop_time or self.budgeted: #timebound and budget check
+                reason = self._budget_exhausted()
+                if reason:
+                    self._sma_queue(rec)
+                    return self._exhausted(reason)
+
+            if self.best_node is None or node.hval < self.best_node.hval:
+                self.best_node = node
+
+            t = clock()
+            successors = node.state.successors()
+            stats.successor_time += clock() - t
+            stats.expanded = stats.expanded + 1
+            stats.generated = stats.generated + len(successors)
+            if sink is not None:
+                sink.on_expand(node, successors)
+
+            #successors that are still in memory are not added again
+            survivors = []
+            for succ in successors:
+                key = succ.hashable_state()
+                if key in rec.children:
+                    continue
+                if self.cycle_check == _CC_PATH and succ.has_path_cycle():
+                    stats.cycle_check_pruned = stats.cycle_check_pruned + 1
+                    if sink is not None:
+                        sink.on_prune(succ, 'cycle_check')
+                    continue
+                survivors.append((succ, key))
+
+            #node is complete once its successors are in memory (or forgotten)
+            rec.expanded = True
+            rec.forgotten = infinity
+            hvals = self._heuristic_values(heur_fn, [succ for succ, key in survivors])
+            for (succ, key), succ_hval in zip(survivors, hvals):
+                if costbound is not None and (succ.gval > costbound[0] or
+                                              succ_hval > costbound[1] or
+                                              succ.gval + succ_hval > costbound[2]) :
+                    stats.cost_bound_pruned = stats.cost_bound_pruned + 1
+                    if sink is not None:
+                        sink.on_prune(succ, 'cost_bound')
+                    continue
+                #make room before storing the child
+                while self.sma_count >= limit:
+                    if not self._sma_evict(sink, rec):
+                        return self._exhausted('node_limit')
+                child_node = self._new_node(succ, succ_hval, node.index, node.depth + 1)
+                child_f = max(rec.f, succ.gval + succ_hval)
+                if child_node.depth >= limit - 1 and not goal_fn(succ):
+                    child_f = infinity
+                child = _SMANode(child_node, child_f, rec, key)
+                rec.children[key] = child
+                self.sma_count = self.sma_count + 1
+                if self.sma_count > stats.peak_open:
+                    stats.peak_open = self.sma_count
+                self._sma_queue(child)
+                if sink is not None:
+                    sink.on_generate(child_node)
+
+            if not rec.children and rec.forgotten == infinity:
+                #a dead end, kept as a leaf so it is forgotten first
+                rec.f = infinity
+                self._sma_queue(rec)
+            self._sma_backup(rec)
+            if rec.parent is not None and not rec.children:
+                self._sma_backup(rec.parent)
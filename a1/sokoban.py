@@ -11,10 +11,360 @@
     Code also contains a list of 40 Sokoban problems for the purpose of testing.
 """
 
+import copy
+import random
+from collections import Counter, deque, OrderedDict
 from search import *
 
+#Zobrist hashing. Every (item, cell) pair, where the item is the robot
+#or a box with a given restriction index, has a fixed random 64-bit
+#number, and the key of a state is the XOR of the numbers of all its
+#items. A move changes the key by XORing out the numbers of the items
+#at their old cells and XORing in the numbers at their new cells. The
+#numbers are derived from the pair itself, so they are the same in
+#every process.
+_ZOBRIST_ROBOT = -1
+_zobrist_numbers = dict()
+
+def zobrist_number(item, cell):
+    """
+    Return the random 64-bit number for item (_ZOBRIST_ROBOT for the robot,
+    otherwise the box's restriction index) at cell.
+    """
+    number = _zobrist_numbers.get((item, cell))
+    if number is None:
+        number = random.Random(hash((item, cell[0], cell[1]))).getrandbits(64)
+        _zobrist_numbers[(item, cell)] = number
+    return number
+
+#Dead squares. A box on a dead square can never be pushed to a storage
+#point it may be stored at (even with no other boxes in the way), so a
+#push onto a dead square can't lead to a goal. The cells a box can
+#reach storage from are the cells it can be pulled to from that
+#storage: a pull moves the box one cell, with the robot stepping back
+#ahead of it, so it needs both of those cells free. The maps depend
+#only on the level, so each level's maps are computed once and shared.
+_dead_square_maps = dict()
+
+def pull_distances(width, height, obstacles, targets):
+    """
+    Return a dictionary from each free cell from which a box can be pushed to one of
+    targets to the least number of pushes that takes (with no other boxes in the way).
+    Found breadth first, by pulling the box from targets.
+    """
+    def free(cell):
+        return 0 <= cell[0] < width and 0 <= cell[1] < height and cell not in obstacles
+
+    distance = dict((cell, 0) for cell in targets if free(cell))
+    frontier = deque(distance)
+    while frontier:
+        cell = frontier.popleft()
+        for direction in (UP, RIGHT, DOWN, LEFT):
+            box = direction.move(cell)
+            if box in distance or not free(box) or not free(direction.move(box)):
+                continue
+            distance[box] = distance[cell] + 1
+            frontier.append(box)
+    return distance
+
+def dead_squares(state):
+    """
+    Return a dictionary from the restriction index of each of state's boxes to the
+    frozenset of dead squares for a box with that restriction: the free cells from
+    which the box can't be pushed to any storage point it may be stored at.
+
+    The maps are cached by level (dimensions, obstacles, storage and restrictions).
+    """
+    key = (state.width, state.height, state.obstacles, frozenset(state.storage), state.restrictions)
+    maps = _dead_square_maps.get(key)
+    if maps is None:
+        maps = _dead_square_maps[key] = dict()
+    if any(index not in maps for index in state.boxes.values()):
+        cells = [(x, y) for x in range(state.width) for y in range(state.height)
+                 if (x, y) not in state.obstacles]
+        by_targets = dict()
+        for index in set(state.boxes.values()):
+            if index in maps:
+                continue
+            if state.restrictions is None:
+                targets = frozenset(state.storage)
+            else:
+                targets = state.restrictions[index]
+            if targets not in by_targets:
+                live = pull_distances(state.width, state.height, state.obstacles, targets)
+                by_targets[targets] = frozenset(cell for cell in cells if cell not in live)
+            maps[index] = by_targets[targets]
+    return maps
+
+class SokobanOptions:
+    """
+    Options for the successors of a Sokoban state: which pushes are pruned, and
+    counts of the pushes pruned. A state's successors share its options, so the
+    options given to an initial state (see with_options) apply to, and count, the
+    search from it, and searches from other states are not affected.
+    """
+
+    def __init__(self, dead_squares=True, freeze=False, corral_limit=None, count=True,
+                 canonical_keys=False, region_cache_size=100000):
+        """
+        @param dead_squares: drop pushes of a box onto a dead square (see dead_squares).
+        @param freeze: drop pushes that leave a box frozen off storage (see freeze_deadlock).
+        @param corral_limit: if not None, also drop pushes that close a corral that can't
+               be cleared (see corral_deadlock), searching at most this many states per check.
+        @param count: count the pruned pushes by cause ('dead_square', 'freeze' or
+               'corral') in self.counts.
+        @param canonical_keys: give SokobanPushStates their canonical_key as their
+               hashable_state(), so states with the same boxes whose robots can walk
+               to each other are treated as the same state: cycle checking keeps only
+               the first of them found. Walking costs within a region are ignored, so
+               searches may no longer find the cheapest solution. Single step
+               SokobanStates always keep their Zobrist key (a walk step would
+               otherwise have its parent's key and be pruned).
+        @param region_cache_size: the number of box layouts whose robot regions are
+               cached (in self.region_cache) for canonical keys.
+        """
+        self.dead_squares = dead_squares
+        self.freeze = freeze
+        self.corral_limit = corral_limit
+        self.counts = Counter() if count else None
+        self.canonical_keys = canonical_keys
+        self.region_cache_size = region_cache_size
+        self.region_cache = OrderedDict()
+
+#the options of states that were not given any: dead squares only, not counted
+_DEFAULT_OPTIONS = SokobanOptions(count=False)
+
+def with_options(state, options):
+    """
+    Return a copy of the Sokoban state state (e.g., an initial state from PROBLEMS)
+    whose successors use options, a SokobanOptions.
+    """
+    state = copy.copy(state)
+    state.options = options
+    return state
+
+def _wall(state, cell):
+    """
+    Return True if cell is outside the room or an obstacle.
+    """
+    return (cell[0] < 0 or cell[0] >= state.width or cell[1] < 0 or cell[1] >= state.height or
+            cell in state.obstacles)
+
+def _on_target(state, box, index):
+    """
+    Return True if a box with restriction index is at a storage point it may be stored at.
+    """
+    if state.restrictions is None:
+        return box in state.storage
+    return box in state.restrictions[index]
+
+def _flood(state, boxes, start):
+    """
+    Return the set of cells the robot can walk to from start, with boxes in the way.
+    """
+    reached = {start}
+    frontier = [start]
+    while frontier:
+        cell = frontier.pop()
+        for direction in (UP, RIGHT, DOWN, LEFT):
+            next_cell = direction.move(cell)
+            if next_cell in reached or next_cell in boxes or _wall(state, next_cell):
+                continue
+            reached.add(next_cell)
+            frontier.append(next_cell)
+    return reached
+
+def _frozen(state, box, dead_map, stack, frozen):
+    """
+    Return True if box can't move along either axis. The boxes on stack (being
+    checked) and in frozen (found frozen) count as walls. Each box found frozen
+    is added to frozen.
+    """
+    stack.add(box)
+    mark = len(frozen)
+    dead = dead_map[state.boxes[box]]
+    for back, ahead in ((LEFT, RIGHT), (UP, DOWN)):
+        before = back.move(box)
+        after = ahead.move(box)
+        #blocked if either side is a wall or a frozen box, or both sides are dead squares
+        if not (_blocking(state, before, dead_map, stack, frozen) or
+                _blocking(state, after, dead_map, stack, frozen) or
+                (before in dead and after in dead)):
+            stack.discard(box)
+            #boxes found frozen while box was assumed to be a wall may not be
+            del frozen[mark:]
+            return False
+    stack.discard(box)
+    frozen.append(box)
+    return True
+
+def _blocking(state, cell, dead_map, stack, frozen):
+    """
+    Return True if cell is a wall or a box that can't move.
+    """
+    if _wall(state, cell) or cell in stack or cell in frozen:
+        return True
+    if cell in state.boxes:
+        return _frozen(state, cell, dead_map, stack, frozen)
+    return False
+
+def freeze_deadlock(state, box):
+    """
+    Return True if the box at box (e.g., the box just pushed) is frozen---blocked on
+    both axes by walls, dead squares on both sides or other frozen boxes---and it or
+    one of the boxes frozen with it is not on a storage point it may be stored at.
+    Only the boxes around box are looked at.
+    """
+    dead_map = state.dead_map
+    if dead_map is None:
+        dead_map = state.dead_map = dead_squares(state)
+    frozen = []
+    if not _frozen(state, box, dead_map, set(), frozen):
+        return False
+    for cell in frozen:
+        if not _on_target(state, cell, state.boxes[cell]):
+            return True
+    return False
+
+def corral_deadlock(state, box, limit=1000):
+    """
+    Return True if the box at box (e.g., the box just pushed) closes off a corral,
+    an area the robot can't reach, that can never be cleared.
+
+    Only PI-corrals are checked: those where the robot can't push any box on the
+    edge of the corral outwards, so the corral has to be dealt with from outside.
+    The check searches (breadth first, over pushes) the relaxed problem holding only
+    the boxes on the edge of the corral. The corral can be cleared if a box gets out
+    to where the robot can walk now, or all of these boxes get to storage. As the
+    other boxes can only get in the way, if neither can happen in the relaxed
+    problem it can't happen at all. If the search reaches limit states the corral
+    is assumed to be fine.
+    """
+    dead_map = state.dead_map
+    if dead_map is None:
+        dead_map = state.dead_map = dead_squares(state)
+    boxes = state.boxes
+    reach = _flood(state, boxes, state.robot)
+    checked = set()
+    for direction in (UP, RIGHT, DOWN, LEFT):
+        start = direction.move(box)
+        if start in reach or start in checked or start in boxes or _wall(state, start):
+            continue
+        corral = _flood(state, boxes, start)
+        checked.update(corral)
+        edge = dict()
+        for cell in corral:
+            for side in (UP, RIGHT, DOWN, LEFT):
+                next_cell = side.move(cell)
+                if next_cell in boxes:
+                    edge[next_cell] = boxes[next_cell]
+        if all(_on_target(state, cell, index) for cell, index in edge.items()):
+            continue
+        #the robot must not be able to push an edge box out of the corral
+        pushable = False
+        for cell in edge:
+            for direction in (UP, RIGHT, DOWN, LEFT):
+                robot = (cell[0] - direction.delta[0], cell[1] - direction.delta[1])
+                target = direction.move(cell)
+                if (robot in reach and target not in corral and target not in boxes and
+                    not _wall(state, target)):
+                    pushable = True
+        if not pushable and not _corral_search(state, edge, reach, dead_map, limit):
+            return True
+    return False
+
+def _corral_search(state, edge, reach, dead_map, limit):
+    """
+    Search the relaxed problem of corral_deadlock, with only the boxes in edge. Return
+    True if a box can be pushed into reach, all the boxes can be stored, or the search
+    reaches limit states.
+    """
+    start = dict(edge)
+    region = _flood(state, start, state.robot)
+    seen = {(frozenset(start.items()), min(region))}
+    queue = deque([(start, region)])
+    while queue:
+        boxes, region = queue.popleft()
+        for cell, index in boxes.items():
+            for direction in (UP, RIGHT, DOWN, LEFT):
+                robot = (cell[0] - direction.delta[0], cell[1] - direction.delta[1])
+                target = direction.move(cell)
+                if (robot not in region or target in boxes or _wall(state, target) or
+                    target in dead_map[index]):
+                    continue
+                if target in reach:
+                    return True
+                new_boxes = dict(boxes)
+                del new_boxes[cell]
+                new_boxes[target] = index
+                if all(_on_target(state, box, i) for box, i in new_boxes.items()):
+                    return True
+                new_region = _flood(state, new_boxes, cell)
+                key = (frozenset(new_boxes.items()), min(new_region))
+                if key in seen:
+                    continue
+                if len(seen) >= limit:
+                    return True
+                seen.add(key)
+                queue.append((new_boxes, new_region))
+    return False
+
+#Canonical keys (see SokobanOptions). For each box layout (and level) the
+#region cache of the state's options maps each cell the robot has been
+#found in to the lowest cell of its region, so each region is flood filled
+#once. Entries are popped and reinserted (rather than moved to the end) so
+#a search sharing its options across threads can't lose one in between.
+
+def canonical_key(state):
+    """
+    Return a key for the box layout of state and the region the robot is in: the
+    Zobrist key of the boxes with the robot on the lowest cell it can walk to.
+    """
+    key = state.region_key
+    if key is not None:
+        return key
+    options = state.options or _DEFAULT_OPTIONS
+    cache = options.region_cache
+    box_key = state.zobrist() ^ zobrist_number(_ZOBRIST_ROBOT, state.robot)
+    layout = (box_key, state.width, state.height, state.obstacles)
+    regions = cache.pop(layout, None)
+    if regions is None:
+        regions = dict()
+    cache[layout] = regions
+    while len(cache) > options.region_cache_size:
+        try:
+            cache.popitem(last=False)
+        except KeyError:
+            break
+    cell = regions.get(state.robot)
+    if cell is None:
+        region = _flood(state, state.boxes, state.robot)
+        cell = min(region)
+        for reached in region:
+            regions[reached] = cell
+    key = state.region_key = box_key ^ zobrist_number(_ZOBRIST_ROBOT, cell)
+    return key
+
+def _push_deadlock(state, pushed, options):
+    """
+    Return True if the push that moved a box to pushed (in state) is a deadlock by
+    the checks chosen in options (a SokobanOptions), counting it in options.counts.
+    """
+    if options.freeze and freeze_deadlock(state, pushed):
+        if options.counts is not None:
+            options.counts['freeze'] += 1
+        return True
+    if options.corral_limit is not None and corral_deadlock(state, pushed, options.corral_limit):
+        if options.counts is not None:
+            options.counts['corral'] += 1
+        return True
+    return False
+
 class SokobanState(StateSpace):
 
+    __slots__ = ('width', 'height', 'robot', 'boxes', 'storage', 'obstacles', 'restrictions',
+                 'box_colours', 'storage_colours', 'zobrist_key', 'region_key', 'dead_map', 'options')
+
     def __init__(self, action, gval, parent, width, height, robot, boxes, storage, obstacles,
                  restrictions=None, box_colours=None, storage_colours=None):
         """
@@ -40,13 +390,28 @@ class SokobanState(StateSpace):
         self.restrictions = restrictions
         self.box_colours = box_colours
         self.storage_colours = storage_colours
+        self.zobrist_key = None    #computed when first needed, see zobrist
+        self.region_key = None     #computed when first needed, see canonical_key
+        self.dead_map = None       #computed when first needed, see dead_squares
+        self.options = None        #a SokobanOptions, see with_options (None for the defaults)
 
     def successors(self):
         """
         Generate all the actions that can be performed from this state, and the states those actions will create.        
+
+        Pushes of a box onto a dead square (see dead_squares) are not generated, nor,
+        if the state's options (see SokobanOptions) say so, pushes that freeze a box
+        off storage or close a corral that can't be cleared.
         """
         successors = []
         transition_cost = 1
+        robot_key = self.zobrist() ^ zobrist_number(_ZOBRIST_ROBOT, self.robot)
+        options = self.options or _DEFAULT_OPTIONS
+        counts = options.counts
+        dead_map = self.dead_map
+        if dead_map is None:
+            dead_map = self.dead_map = dead_squares(self)
+        prune_dead = options.dead_squares
 
         for direction in (UP, RIGHT, DOWN, LEFT):
             new_location = direction.move(self.robot)
@@ -59,6 +424,8 @@ class SokobanState(StateSpace):
                 continue
             
             new_boxes = dict(self.boxes)
+            key = robot_key ^ zobrist_number(_ZOBRIST_ROBOT, new_location)
+            pushed = None
 
             if new_location in self.boxes:
                 new_box_location = direction.move(new_location)
@@ -71,9 +438,15 @@ class SokobanState(StateSpace):
                     continue
                 if new_box_location in new_boxes:
                     continue
+                if prune_dead and new_box_location in dead_map[new_boxes[new_location]]:
+                    if counts is not None:
+                        counts['dead_square'] += 1
+                    continue
                 
                 index = new_boxes.pop(new_location)
                 new_boxes[new_box_location] = index
+                pushed = new_box_location
+                key = key ^ zobrist_number(index, new_location) ^ zobrist_number(index, new_box_location)
             
             new_robot = tuple(new_location)
 
@@ -82,6 +455,11 @@ class SokobanState(StateSpace):
                                      boxes=new_boxes, storage=self.storage, obstacles=self.obstacles,
                                      restrictions=self.restrictions, box_colours=self.box_colours,
                                      storage_colours=self.storage_colours)
+            new_state.zobrist_key = key
+            new_state.dead_map = dead_map
+            new_state.options = self.options
+            if pushed is not None and _push_deadlock(new_state, pushed, options):
+                continue
             successors.append(new_state)
 
         return successors
@@ -89,8 +467,31 @@ class SokobanState(StateSpace):
     def hashable_state(self):
         """
         Return a data item that can be used as a dictionary key to UNIQUELY represent a state.
+
+        The key is the state's 64-bit Zobrist key.
+        """
+        return self.zobrist()
+
+    def heuristic_key(self):
+        """
+        Return the state's Zobrist key, which (unlike a canonical key, see
+        SokobanPushState.hashable_state) tells apart robot positions, so heuristics
+        that depend on the robot are cached correctly.
         """
-        return hash((self.robot, frozenset(self.boxes.items())))
+        return self.zobrist()
+
+    def zobrist(self):
+        """
+        Return the state's 64-bit Zobrist key. Successors derive their keys from
+        their parent's key, so only states created directly need it computed here.
+        """
+        key = self.zobrist_key
+        if key is None:
+            key = zobrist_number(_ZOBRIST_ROBOT, self.robot)
+            for box, index in self.boxes.items():
+                key = key ^ zobrist_number(index, box)
+            self.zobrist_key = key
+        return key
 
     def state_string(self):
         """
@@ -188,6 +589,163 @@ class SokobanState(StateSpace):
         print(self.state_string())
 
 
+class SokobanPushState(SokobanState):
+    """
+    A Sokoban state whose successors are box pushes rather than single robot steps.
+
+    A successor pushes a box one cell from anywhere the robot can walk to, and its
+    gval adds the robot's steps (the walk plus the push), so costs are those of the
+    single step problem. Only states right after a push (and the initial state) are
+    generated, so the state space is far smaller. The action of a successor names
+    the box and the direction it is pushed; print_path and expand_path give the
+    solution as single robot moves.
+    """
+
+    __slots__ = ()
+
+    def hashable_state(self):
+        """
+        Return the state's Zobrist key, or its canonical_key if its options (see
+        SokobanOptions) turn canonical keys on.
+        """
+        if self.options is not None and self.options.canonical_keys:
+            return canonical_key(self)
+        return self.zobrist()
+
+    def successors(self):
+        """
+        Generate the states reached by pushing a box one cell, after walking to it.
+        """
+        successors = []
+        width = self.width
+        height = self.height
+        obstacles = self.obstacles
+        boxes = self.boxes
+        robot_key = self.zobrist() ^ zobrist_number(_ZOBRIST_ROBOT, self.robot)
+        options = self.options or _DEFAULT_OPTIONS
+        counts = options.counts
+        dead_map = self.dead_map
+        if dead_map is None:
+            dead_map = self.dead_map = dead_squares(self)
+
+        #breadth first flood fill: the robot's walking distance to each cell it can reach
+        distance = {self.robot: 0}
+        frontier = deque([self.robot])
+        while frontier:
+            cell = frontier.popleft()
+            steps = distance[cell] + 1
+            for direction in (UP, RIGHT, DOWN, LEFT):
+                next_cell = direction.move(cell)
+                if (next_cell in distance or next_cell in boxes or next_cell in obstacles or
+                    next_cell[0] < 0 or next_cell[0] >= width or next_cell[1] < 0 or next_cell[1] >= height):
+                    continue
+                distance[next_cell] = steps
+                frontier.append(next_cell)
+
+        for box, index in boxes.items():
+            for direction in (UP, RIGHT, DOWN, LEFT):
+                robot = (box[0] - direction.delta[0], box[1] - direction.delta[1])
+                if robot not in distance:
+                    continue
+                new_box_location = direction.move(box)
+                if (new_box_location[0] < 0 or new_box_location[0] >= width or
+                    new_box_location[1] < 0 or new_box_location[1] >= height or
+                    new_box_location in obstacles or new_box_location in boxes):
+                    continue
+                if options.dead_squares and new_box_location in dead_map[index]:
+                    if counts is not None:
+                        counts['dead_square'] += 1
+                    continue
+
+                new_boxes = dict(boxes)
+                del new_boxes[box]
+                new_boxes[new_box_location] = index
+                key = (robot_key ^ zobrist_number(_ZOBRIST_ROBOT, box) ^
+                       zobrist_number(index, box) ^ zobrist_number(index, new_box_location))
+                new_state = SokobanPushState(action="push {} {}".format(box, direction.name),
+                                             gval=self.gval + distance[robot] + 1, parent=self,
+                                             width=width, height=height, robot=box,
+                                             boxes=new_boxes, storage=self.storage, obstacles=obstacles,
+                                             restrictions=self.restrictions, box_colours=self.box_colours,
+                                             storage_colours=self.storage_colours)
+                new_state.zobrist_key = key
+                new_state.dead_map = dead_map
+                new_state.options = self.options
+                if _push_deadlock(new_state, new_box_location, options):
+                    continue
+                successors.append(new_state)
+
+        return successors
+
+    def walk(self):
+        """
+        Return the robot moves (Directions) from this state's parent to this state:
+        a shortest walk to the box followed by the push.
+        """
+        parent = self.parent
+        box = self.robot
+        #the pushed box is the one now on a cell that was free
+        direction = [d for d in (UP, RIGHT, DOWN, LEFT)
+                     if d.move(box) in self.boxes and d.move(box) not in parent.boxes][0]
+        goal = (box[0] - direction.delta[0], box[1] - direction.delta[1])
+        previous = {parent.robot: None}
+        frontier = deque([parent.robot])
+        while goal not in previous:
+            cell = frontier.popleft()
+            for d in (UP, RIGHT, DOWN, LEFT):
+                next_cell = d.move(cell)
+                if next_cell in previous or next_cell in parent.boxes or _wall(parent, next_cell):
+                    continue
+                previous[next_cell] = (cell, d)
+                frontier.append(next_cell)
+        moves = [direction]
+        cell = goal
+        while previous[cell] is not None:
+            cell, d = previous[cell]
+            moves.append(d)
+        moves.reverse()
+        return moves
+
+    def expand_path(self):
+        """
+        Return the SokobanState (single step) equivalent of this state, with the path
+        to it made of single robot moves.
+        """
+        pushes = []
+        s = self
+        while s.parent is not None:
+            pushes.append(s)
+            s = s.parent
+        state = SokobanState(s.action, s.gval, None, s.width, s.height, s.robot, s.boxes, s.storage,
+                             s.obstacles, s.restrictions, s.box_colours, s.storage_colours)
+        for push in reversed(pushes):
+            for direction in push.walk():
+                robot = direction.move(state.robot)
+                boxes = state.boxes
+                if robot in boxes:
+                    boxes = dict(boxes)
+                    boxes[direction.move(robot)] = boxes.pop(robot)
+                state = SokobanState(direction.name, state.gval + 1, state, state.width, state.height,
+                                     robot, boxes, state.storage, state.obstacles, state.restrictions,
+                                     state.box_colours, state.storage_colours)
+        return state
+
+    def print_path(self):
+        """
+        Print the path to this state one robot move at a time.
+        """
+        self.expand_path().print_path()
+
+def push_state(state):
+    """
+    Return a SokobanPushState for the Sokoban state state, to search with push successors.
+    """
+    pushes = SokobanPushState(state.action, state.gval, None, state.width, state.height, state.robot,
+                              state.boxes, state.storage, state.obstacles, state.restrictions,
+                              state.box_colours, state.storage_colours)
+    pushes.options = state.options
+    return pushes
+
 def sokoban_goal_state(state):
   """
   Returns True if we have reached a goal state.
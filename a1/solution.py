@@ -7,12 +7,10 @@
 #   You may not import or otherwise source any of your own files
 
 import numpy as np
-# import os for time functions
-import os
 from scipy.optimize import linear_sum_assignment
 from scipy.spatial.distance import chebyshev, cityblock, euclidean, hamming
 from search import * #for search engines
-from sokoban import SokobanState, Direction, PROBLEMS, sokoban_goal_state #for Sokoban specific classes and problems
+from sokoban import SokobanState, Direction, PROBLEMS, sokoban_goal_state, pull_distances #for Sokoban specific classes and problems
 
 #SOKOBAN HEURISTICS
 def heur_displaced(state):
@@ -151,6 +149,153 @@ def heur_alternate(state):
     # Include wall positions into the obstacles
     return result
 
+def _batch_tensors(states):
+    '''Stack the box and storage positions of states (which must be states of
+       the same level, e.g. the successors of one state) for the batched heuristics.
+       Returns boxes (S x B x 2), storage (K x 2), allowed (S x B x K, True where
+       the box may be stored at the storage point) and the list of box positions
+       of each state (in the same order as boxes).'''
+    first = states[0]
+    storage_pos = list(first.storage)
+    storage = np.array(storage_pos).reshape(-1, 2)
+    box_pos = [list(state.boxes) for state in states]
+    boxes = np.array(box_pos).reshape(len(states), -1, 2)
+    if first.restrictions is None:
+        allowed = np.ones((boxes.shape[0], boxes.shape[1], len(storage_pos)), dtype=bool)
+    else:
+        #allowed storage points of each restriction, then of each box
+        by_restriction = np.array([[pos in allowed_pos for pos in storage_pos] for allowed_pos in first.restrictions],
+                                  dtype=bool).reshape(len(first.restrictions), len(storage_pos))
+        restriction = np.array([[state.boxes[pos] for pos in positions] for state, positions in zip(states, box_pos)],
+                               dtype=int).reshape(boxes.shape[0], boxes.shape[1])
+        allowed = by_restriction[restriction]
+    return boxes, storage, allowed, box_pos
+
+def heur_manhattan_distance_batch(states):
+    '''heur_manhattan_distance of each of states (states of the same level), computed
+       with one boxes x storage distance tensor. For SearchEngine's heur_batch_fn.'''
+    boxes, storage, allowed, box_pos = _batch_tensors(states)
+    dist = np.abs(boxes[:, :, None, :] - storage[None, None, :, :]).sum(axis=3).astype(float)
+    dist[~allowed] = np.inf
+    if dist.shape[2] == 0:
+        return [float("inf") if dist.shape[1] else 0] * len(states)
+    return dist.min(axis=2).sum(axis=1).tolist()
+
+def heur_alternate_batch(states):
+    '''heur_alternate of each of states (states of the same level). The cost matrices
+       of all the states are built as one states x boxes x storage tensor (with the
+       rules of calc_heur_alternate_dist) and each is then solved with
+       linear_sum_assignment. For SearchEngine's heur_batch_fn.'''
+    boxes, storage, allowed, box_pos = _batch_tensors(states)
+    first = states[0]
+    obst = first.obstacles
+    width = first.width
+    height = first.height
+    invalid_dist = width + height + 1
+
+    #storage points that can never be reached (obstacles are the same in every state)
+    blocked_storage = []
+    for (a, b) in first.storage:
+        aplus = (a + 1, b) in obst
+        aminus = (a - 1, b) in obst
+        bplus = (a, b + 1) in obst
+        bminus = (a, b - 1) in obst
+        blocked_storage.append((aplus and aminus and bplus and bminus) or
+                               ((a, b) == (0, 0) and aplus and bplus) or
+                               (a + 1 == width and b == 0 and aminus and bplus) or
+                               (a == 0 and b + 1 == height and aplus and bminus) or
+                               (a + 1 == width and b + 1 == height and aminus and bminus))
+    blocked_storage = np.array(blocked_storage, dtype=bool)
+
+    #boxes blocked both horizontally and vertically
+    stuck = np.array([[(x == 0 or x == width - 1 or (x + 1, y) in obst or (x - 1, y) in obst) and
+                       (y == 0 or y == height - 1 or (x, y + 1) in obst or (x, y - 1) in obst)
+                       for (x, y) in positions] for positions in box_pos], dtype=bool).reshape(boxes.shape[:2])
+
+    diff = np.abs(boxes[:, :, None, :] - storage[None, None, :, :])
+    cost = diff.sum(axis=3).astype(float)
+    cost[stuck[:, :, None] | blocked_storage[None, None, :]] = invalid_dist
+    cost[(diff == 0).all(axis=3)] = 0
+    cost[~allowed] = invalid_dist
+
+    robot = np.array([state.robot for state in states]).reshape(len(states), 1, 2)
+    robot_dist = np.abs(boxes - robot).sum(axis=2).astype(float).min(axis=1, initial=np.inf)
+
+    result = []
+    for i in range(len(states)):
+        row_ind, col_ind = linear_sum_assignment(cost[i])
+        result.append(cost[i][row_ind, col_ind].sum() + robot_dist[i])
+    return result
+
+class PushTable:
+    '''True push distances of a level: dist[k, x, y] is the least number of pushes
+       that take a box from (x, y) to storage point storage_pos[k] with no other
+       boxes in the way (inf if it can't get there), and nearest[index][x, y] the
+       least over the storage points a box with restriction index may be stored at.'''
+
+    def __init__(self, state):
+        width = state.width
+        height = state.height
+        self.storage_pos = list(state.storage)
+        self.dist = np.full((len(self.storage_pos), width, height), np.inf)
+        for k, pos in enumerate(self.storage_pos):
+            for (x, y), pushes in pull_distances(width, height, state.obstacles, (pos,)).items():
+                self.dist[k, x, y] = pushes
+        if state.restrictions is None:
+            allowed = [np.ones(len(self.storage_pos), dtype=bool)]
+        else:
+            allowed = [np.array([pos in restriction for pos in self.storage_pos], dtype=bool)
+                       for restriction in state.restrictions]
+        self.allowed = allowed
+        self.nearest = [self.dist[mask].min(axis=0) if mask.any() else np.full((width, height), np.inf)
+                        for mask in allowed]
+
+_push_tables = dict()
+
+def push_table(state):
+    '''The PushTable of state's level, computed once per level: the tables are cached
+       by (width, height, obstacles, storage, restrictions).'''
+    key = (state.width, state.height, state.obstacles, frozenset(state.storage), state.restrictions)
+    table = _push_tables.get(key)
+    if table is None:
+        table = _push_tables[key] = PushTable(state)
+    return table
+
+def heur_push_distance(state):
+    '''admissible sokoban heuristic: the sum over the boxes of the least number of
+       pushes to a storage point the box may be stored at, taking walls into account
+       (but not the other boxes). Never less than heur_manhattan_distance, and each
+       box is one table lookup.'''
+    table = push_table(state)
+    nearest = table.nearest
+    restricted = state.restrictions is not None
+    total = 0
+    for (x, y), restriction in state.boxes.items():
+        total += nearest[restriction if restricted else 0][x, y]
+    return float(total)
+
+def heur_push_assignment(state):
+    '''admissible sokoban heuristic: the least total number of pushes when each box
+       goes to its own storage point (an assignment solved with linear_sum_assignment
+       over the push distance table).'''
+    table = push_table(state)
+    restricted = state.restrictions is not None
+    positions = list(state.boxes)
+    xs = [pos[0] for pos in positions]
+    ys = [pos[1] for pos in positions]
+    cost = table.dist[:, xs, ys].T
+    if restricted:
+        allowed = np.array([table.allowed[state.boxes[pos]] for pos in positions]).reshape(cost.shape)
+        cost = np.where(allowed, cost, np.inf)
+    #boxes that can't get to storage: linear_sum_assignment needs a feasible matrix
+    invalid = state.width * state.height * (len(positions) + 1)
+    finite = np.where(np.isinf(cost), invalid, cost)
+    row_ind, col_ind = linear_sum_assignment(finite)
+    result = finite[row_ind, col_ind].sum()
+    if result >= invalid or len(row_ind) < len(positions):
+        return float("inf")
+    return float(result)
+
 def fval_function(sN, weight):
 #IMPLEMENT
     """
@@ -175,31 +320,13 @@ def anytime_gbfs(initial_state, heur_fn, timebound = 10):
     '''Provides an implementation of anytime greedy best-first search, as described in the HW1 handout'''
     '''INPUT: a sokoban state that represents the start state and a timebound (number of seconds)'''
     '''OUTPUT: A goal state (if a goal is found), else False''' 
-    i = 0 
-    goal_state = False
     best_state = False
-    best_gval = 0
-    prune = float("inf") 
     se = SearchEngine('best_first')
     se.init_search(initial_state, sokoban_goal_state, heur_fn)
-    while timebound > 0:
-        if (i == 0):
-             goal_state = se.search(timebound) 
-             best_state = goal_state
-             if goal_state is not False: 
-                 best_gval = goal_state.gval
-             i += 1
-        else:
-             # Current path is worse.
-             if (goal_state is not False) and (goal_state.gval >= best_gval):
-                 prune = goal_state.gval
-                 goal_state = se.search(timebound, (prune, float("inf"), float("inf")))
-             elif (goal_state is not False) and (goal_state.gval < best_gval):
-                 best_state = goal_state
-                 best_gval = goal_state.gval
-                 goal_state = se.search(timebound, (prune, float("inf"), float("inf")))
-        timebound -= os.times()[0] - se.search_start_time
-
+    # Each solution is cheaper than the last; states whose gval exceeds
+    # the best solution's cost are pruned.
+    for solution in se.iter_solutions(timebound, prune_on='gval'):
+        best_state = solution.state
     return best_state 
 
 def anytime_weighted_astar(initial_state, heur_fn, weight=1., timebound = 10):
@@ -207,37 +334,13 @@ def anytime_weighted_astar(initial_state, heur_fn, weight=1., timebound = 10):
     '''Provides an implementation of anytime weighted a-star, as described in the HW1 handout'''
     '''INPUT: a sokoban state that represents the start state and a timebound (number of seconds)'''
     '''OUTPUT: A goal state (if a goal is found), else False''' 
-    i = 0
     best_state = False # The goal state to return
-    goal_state = False # Current goal state
-    prune = float("inf") # Value to prune on
-    best_path = 0 
     se = SearchEngine('custom')
     wrapped_fval_fn = (lambda sN: fval_function(sN, weight))
     se.init_search(initial_state, sokoban_goal_state, heur_fn, wrapped_fval_fn)
-
-    while timebound > 0:
-        if (i == 0):
-            goal_state = se.search(timebound)
-            best_state = goal_state
-            if goal_state is not False:
-                curr_hval = heur_fn(goal_state)
-                best_path = goal_state.gval + curr_hval
-            i += 1
-        else:
-            if (goal_state is not False):
-                curr_hval = heur_fn(goal_state) 
-                curr_val = goal_state.gval + curr_hval
-                # If the path became worse, change the prune value
-                if curr_val >= best_path:
-                    prune = curr_val
-                # A better path was found
-                elif curr_val < best_path:
-                    # Change the choice of best goal state 
-                    best_state = goal_state
-                    best_path = curr_val
-                goal_state = se.search(timebound, (float("inf"), float("inf"), curr_val))
-        timebound -= os.times()[0] - se.search_start_time
+    # Prune states whose gval + hval exceeds the best solution's cost.
+    for solution in se.iter_solutions(timebound, prune_on='fval'):
+        best_state = solution.state
     return best_state 
 
 if __name__ == "__main__":
@@ -0,0 +1,319 @@
+#Checks for SearchEngine on small hand made state spaces.
+#Run with "python test_search.py" (or pytest).
+
+import copy
+import os
+import tempfile
+from search import *
+import search
+from closed_list import MappedClosedList, SpillingClosedList
+import sokoban
+import solution
+
+class GraphState(StateSpace):
+    '''A state of a small weighted graph: edges maps each vertex to a
+       list of (successor, cost) pairs.'''
+    __slots__ = ('vertex', 'edges')
+
+    def __init__(self, action, gval, parent, vertex, edges):
+        StateSpace.__init__(self, action, gval, parent)
+        self.vertex = vertex
+        self.edges = edges
+
+    def successors(self):
+        return [GraphState(succ, self.gval + cost, self, succ, self.edges)
+                for succ, cost in self.edges.get(self.vertex, [])]
+
+    def hashable_state(self):
+        return self.vertex
+
+    def print_state(self):
+        print(self.vertex, end="")
+
+#A->B is expensive, A->C->B is cheap. With h(C) < h(B) the cheaper path to
+#B is found while B (reached directly) is still on OPEN.
+DETOUR = {'A': [('B', 5), ('C', 1)], 'C': [('B', 1)], 'B': [('G', 1)]}
+DETOUR_H = {'A': 2, 'B': 1, 'C': 0, 'G': 0}
+
+def detour_search(strategy, decrease_key=True, **kwargs):
+    se = SearchEngine(strategy, 'full')
+    se.set_verbose(False)
+    se.set_decrease_key(decrease_key)
+    se.init_search(GraphState('START', 0, None, 'A', DETOUR), lambda s: s.vertex == 'G',
+                   lambda s: DETOUR_H[s.vertex], **kwargs)
+    return se.search(5)
+
+def test_decrease_key_keeps_cheaper_path():
+    '''A cheaper path to a state on OPEN must replace it, even when the
+       priority doesn't depend on gval (best_first, custom)'''
+    for strategy in ['best_first', 'custom', 'astar', 'ucs']:
+        for decrease_key in [True, False]:
+            goal = detour_search(strategy, decrease_key)
+            assert goal, (strategy, decrease_key)
+            assert goal.gval == 3, (strategy, decrease_key, goal.gval)
+
+#A 6x6 grid with string vertex names; unit cost moves right and down
+GRID = dict(("{},{}".format(x, y), [("{},{}".format(x + 1, y), 1)] * (x < 5) + [("{},{}".format(x, y + 1), 1)] * (y < 5))
+            for x in range(6) for y in range(6))
+
+def grid_engine():
+    se = SearchEngine('astar', 'full')
+    se.set_verbose(False)
+    return se
+
+def test_mapped_closed_list():
+    '''MappedClosedList grows, resolves collisions by linear probing and
+       stores key 0 (the empty record marker) as another key'''
+    table = MappedClosedList(capacity=4)
+    path = table.path
+    for key in range(200):
+        table[key] = key / 2
+    table[(1, 2)] = 7
+    table['a'] = 8
+    assert len(table) == 202 and table.capacity >= 202 / table.max_load
+    assert all(table[key] == key / 2 for key in range(200))
+    assert table[(1, 2)] == 7 and table['a'] == 8
+    assert 0 in table and table[0] == 0 and table.get(200) is None and 200 not in table
+    table[5] = 1
+    assert table[5] == 1 and len(table) == 202
+    assert sorted(g for k, g in table.items()) == sorted([key / 2 for key in range(200) if key != 5] + [1, 7, 8])
+    table.close()
+    assert not os.path.exists(path)
+
+    #these keys all hash to record 0 of a full table (no growth), so are found by probing
+    table = MappedClosedList(capacity=8, max_load=1)
+    for key in range(1, 9):
+        table[key << 40] = key
+    assert [table[key << 40] for key in range(1, 9)] == list(range(1, 9))
+    table.close()
+
+def test_spilling_closed_list():
+    '''SpillingClosedList moves its entries to a MappedClosedList once it
+       holds more than max_entries, and searches give the same costs'''
+    table = SpillingClosedList(max_entries=10)
+    for key in range(10):
+        table['s{}'.format(key)] = key
+    assert not table.spilled and not table.hashed_keys
+    table['s10'] = 10
+    assert table.spilled and table.hashed_keys and len(table) == 11
+    assert all(table['s{}'.format(key)] == key for key in range(11))
+    table.close()
+
+    costs = []
+    for closed_list in [dict, MappedClosedList, lambda: SpillingClosedList(max_entries=50)]:
+        se = SearchEngine('astar', 'full')
+        se.set_verbose(False)
+        se.set_closed_list(closed_list)
+        se.init_search(sokoban.PROBLEMS[1], sokoban.sokoban_goal_state, solution.heur_manhattan_distance)
+        goal = se.search(20)
+        costs.append((goal.gval, se.stats.expanded))
+    assert costs[0] == costs[1] == costs[2], costs
+
+def test_resume_mapped_closed_list():
+    '''A checkpoint of a search with a MappedClosedList (which hashes
+       string keys) can be resumed by an engine with the default dict'''
+    se = grid_engine()
+    se.set_closed_list(MappedClosedList)
+    se.set_budget(expanded=10)
+    goal_fn = lambda s: s.vertex == '5,5'
+    se.init_search(GraphState('START', 0, None, '0,0', GRID), goal_fn)
+    assert not se.search(5)
+    path = os.path.join(tempfile.mkdtemp(), 'grid.ckpt')
+    se.checkpoint(path)
+
+    resumed = grid_engine()
+    assert resumed.resume(path, goal_fn=goal_fn, heur_fn=lambda s: 0)
+    resumed.set_budget()
+    goal = resumed.search(5)
+    assert goal and goal.gval == 10
+    os.remove(path)
+
+def test_resume_in_chunks():
+    '''The closed list is streamed into the checkpoint in chunks, from a
+       dict or a spilled SpillingClosedList'''
+    chunk = search._CHECKPOINT_CHUNK
+    search._CHECKPOINT_CHUNK = 4
+    try:
+        for closed_list in [dict, lambda: SpillingClosedList(max_entries=5)]:
+            se = grid_engine()
+            se.set_closed_list(closed_list)
+            se.set_budget(expanded=12)
+            goal_fn = lambda s: s.vertex == '5,5'
+            se.init_search(GraphState('START', 0, None, '0,0', GRID), goal_fn)
+            assert not se.search(5)
+            saved = len(se.cc_dictionary)
+            assert saved > 3 * search._CHECKPOINT_CHUNK
+            path = os.path.join(tempfile.mkdtemp(), 'grid.ckpt')
+            se.checkpoint(path)
+
+            resumed = grid_engine()
+            assert resumed.resume(path, goal_fn=goal_fn, heur_fn=lambda s: 0)
+            assert len(resumed.cc_dictionary) == saved
+            resumed.set_budget()
+            goal = resumed.search(5)
+            assert goal and goal.gval == 10
+            os.remove(path)
+    finally:
+        search._CHECKPOINT_CHUNK = chunk
+
+def test_sinks_for_every_strategy():
+    '''Every strategy sends its expansions and goal to the sinks'''
+    for strategy in ['depth_first', 'breadth_first', 'ucs', 'best_first', 'astar', 'custom',
+                     'ida_star', 'beam', 'beam_stack', 'focal', 'rbfs', 'sma_star']:
+        se = SearchEngine(strategy)
+        se.set_verbose(False)
+        counter = CounterSink()
+        se.add_sink(counter)
+        se.init_search(GraphState('START', 0, None, '0,0', GRID), lambda s: s.vertex == '5,5',
+                       lambda s: 10 - sum(int(c) for c in s.vertex.split(',')))
+        assert se.search(5), strategy
+        assert counter.counts['expand'] == se.stats.expanded > 0, (strategy, counter.counts)
+        assert counter.counts['goal'] == 1, strategy
+        assert counter.counts['prune_f_bound'] == se.stats.f_bound_pruned, strategy
+
+def test_rbfs_f_bound():
+    '''RBFS counts (and sends) the subtrees it drops over their f limit'''
+    se = SearchEngine('rbfs', 'path')
+    se.set_verbose(False)
+    counter = CounterSink()
+    se.add_sink(counter)
+    se.init_search(sokoban.PROBLEMS[0], sokoban.sokoban_goal_state, solution.heur_manhattan_distance)
+    goal = se.search(20)
+    assert goal and goal.gval == 23
+    assert counter.counts['prune_f_bound'] == se.stats.f_bound_pruned > 0
+
+def test_sma_star_node_limit():
+    '''SMA* never stores more than node_limit nodes, counts the leaves
+       it forgets, and still finds the cheapest solution'''
+    for limit in [30, 60, 200]:
+        se = SearchEngine('sma_star', 'path')
+        se.set_verbose(False)
+        se.set_node_limit(limit)
+        se.init_search(sokoban.PROBLEMS[0], sokoban.sokoban_goal_state, solution.heur_manhattan_distance)
+        goal = se.search(20)
+        assert goal and goal.gval == 23, limit
+        assert se.stats.peak_open <= limit, (limit, se.stats.peak_open)
+        assert se.stats.forgotten_pruned > 0
+        assert se.stats.as_dict()['pruned']['forgotten'] == se.stats.forgotten_pruned
+
+def test_small_node_limits():
+    '''Under node limits too small for the solution SMA* reports no
+       solution and RBFS stops with a node_limit budget; neither stores
+       more than the limit. RBFS can be continued with a higher limit.'''
+    goal_fn = lambda s: s.vertex == '5,5'
+    for limit in [5, 8, 12]:
+        for strategy in ['sma_star', 'rbfs']:
+            se = SearchEngine(strategy, 'path')
+            se.set_verbose(False)
+            se.set_node_limit(limit)
+            se.init_search(GraphState('START', 0, None, '0,0', GRID), goal_fn)
+            goal = se.search(5)
+            assert se.stats.peak_open <= limit, (strategy, limit, se.stats.peak_open)
+            if strategy == 'sma_star' and limit > 10:
+                assert goal and goal.gval == 10
+            elif strategy == 'sma_star':
+                assert goal is False, limit
+            else:
+                assert isinstance(goal, BudgetExhausted) and goal.reason == 'node_limit', limit
+
+    se = SearchEngine('rbfs', 'path')
+    se.set_verbose(False)
+    se.set_node_limit(20)
+    se.init_search(sokoban.PROBLEMS[0], sokoban.sokoban_goal_state, solution.heur_manhattan_distance)
+    assert not se.search(20) and se.stats.peak_open <= 20
+    se.set_node_limit(None)
+    goal = se.search(20)
+    assert goal and goal.gval == 23
+
+def test_incremental_zobrist_keys():
+    '''The keys successors derive from their parent's key match keys
+       computed from scratch, for single step and push successors'''
+    for i in range(6):
+        for state in [sokoban.PROBLEMS[i], sokoban.push_state(sokoban.PROBLEMS[i])]:
+            frontier = [state]
+            for depth in range(4):
+                frontier = [succ for s in frontier[:30] for succ in s.successors()]
+                for succ in frontier:
+                    fresh = copy.copy(succ)
+                    fresh.zobrist_key = None
+                    assert succ.zobrist() == fresh.zobrist(), (i, depth)
+
+def room(boxes, storage, robot=(4, 2)):
+    '''A 5x3 Sokoban room with no obstacles'''
+    return sokoban.SokobanState('START', 0, None, 5, 3, robot, dict((box, 0) for box in boxes),
+                                dict((cell, i) for i, cell in enumerate(storage)), frozenset())
+
+def test_deadlock_detectors():
+    '''freeze_deadlock and corral_deadlock on small rooms'''
+    #two boxes side by side against a wall can't move
+    assert sokoban.freeze_deadlock(room([(1, 0), (2, 0)], [(1, 2), (2, 2)]), (1, 0))
+    assert sokoban.freeze_deadlock(room([(1, 0), (2, 0)], [(1, 0), (2, 2)]), (2, 0))
+    assert not sokoban.freeze_deadlock(room([(1, 0), (2, 0)], [(1, 0), (2, 0)]), (1, 0))
+    assert not sokoban.freeze_deadlock(room([(2, 1)], [(1, 2)]), (2, 1))
+    #the corner (0, 0) closed off by two boxes can only be cleared onto storage in it
+    assert sokoban.corral_deadlock(room([(1, 0), (0, 1)], [(3, 2), (4, 1)]), (0, 1))
+    assert not sokoban.corral_deadlock(room([(1, 0), (0, 1)], [(0, 0), (1, 0)]), (0, 1))
+    assert not sokoban.corral_deadlock(room([(2, 1)], [(3, 2)]), (2, 1))
+
+def test_deadlock_pruning_keeps_costs():
+    '''Dead square, freeze and corral pruning don't change the cost of
+       the solutions found, and each search keeps its own counts'''
+    for i in range(6):
+        costs = []
+        unpruned, pruned = sokoban.SokobanOptions(dead_squares=False), sokoban.SokobanOptions(freeze=True, corral_limit=200)
+        for options in [unpruned, sokoban.SokobanOptions(), pruned]:
+            for pushes in [False, True]:
+                state = sokoban.with_options(sokoban.PROBLEMS[i], options)
+                se = SearchEngine('astar', 'full')
+                se.set_verbose(False)
+                se.init_search(sokoban.push_state(state) if pushes else state,
+                               sokoban.sokoban_goal_state, solution.heur_manhattan_distance)
+                goal = se.search(20)
+                assert goal, (i, pushes)
+                costs.append(goal.gval)
+        assert len(set(costs)) == 1, (i, costs)
+        assert sum(unpruned.counts.values()) == 0 and sum(pruned.counts.values()) > 0, i
+
+def test_heuristic_cache_with_canonical_keys():
+    '''Canonical keys merge push states that differ only in the robot's
+       cell in its region, but heuristics may depend on the robot, so the
+       cache must not'''
+    state = sokoban.with_options(sokoban.PROBLEMS[0], sokoban.SokobanOptions(canonical_keys=True))
+    walked = [succ for succ in state.successors() if succ.boxes == state.boxes]
+    assert walked and walked[0].hashable_state() != state.hashable_state()
+    pushes = sokoban.push_state(state)
+    walked = sokoban.push_state(walked[0])
+    assert walked.hashable_state() == pushes.hashable_state()
+    cache = HeuristicCache(lambda s: s.robot[0] + 10 * s.robot[1], 10)
+    assert cache(pushes) == pushes.robot[0] + 10 * pushes.robot[1]
+    assert cache(walked) == walked.robot[0] + 10 * walked.robot[1]
+
+def test_canonical_keys_per_search():
+    '''Canonical keys given to one search don't change the keys (or the
+       results) of single step searches'''
+    options = sokoban.SokobanOptions(canonical_keys=True)
+    for i in range(3):
+        for state in [sokoban.with_options(sokoban.PROBLEMS[i], options), sokoban.PROBLEMS[i],
+                      sokoban.push_state(sokoban.with_options(sokoban.PROBLEMS[i], options))]:
+            se = SearchEngine('astar', 'full')
+            se.set_verbose(False)
+            se.init_search(state, sokoban.sokoban_goal_state, solution.heur_manhattan_distance)
+            assert se.search(10), (i, state.options)
+    assert len(options.region_cache) > 0
+
+if __name__ == "__main__":
+    test_decrease_key_keeps_cheaper_path()
+    test_mapped_closed_list()
+    test_spilling_closed_list()
+    test_resume_mapped_closed_list()
+    test_resume_in_chunks()
+    test_sinks_for_every_strategy()
+    test_rbfs_f_bound()
+    test_sma_star_node_limit()
+    test_small_node_limits()
+    test_incremental_zobrist_keys()
+    test_deadlock_detectors()
+    test_deadlock_pruning_keeps_costs()
+    test_heuristic_cache_with_canonical_keys()
+    test_canonical_keys_per_search()
+    print("All checks passed")